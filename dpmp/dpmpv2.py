@@ -16,9 +16,17 @@ import asyncio
 import itertools
 import datetime as dt
 import json
+import queue
 import time
 import os
+import random
 import signal
+import socket
+import sys
+from collections import OrderedDict
+from heapq import nsmallest
+from operator import itemgetter
+from math import ceil
 from dataclasses import dataclass
 from typing import Any, Dict, Optional
 
@@ -27,6 +35,12 @@ try:
 except Exception:
     orjson = None
 
+# libuv-based event loop (faster socket I/O); stdlib asyncio loop if missing
+try:
+    import uvloop  # type: ignore
+except Exception:
+    uvloop = None
+
 from prometheus_client import Counter, Gauge, start_http_server
 
 CONN_DOWNSTREAM = Gauge("dpmp_downstream_connections", "Active downstream miner connections")
@@ -43,6 +57,23 @@ SCHEDULER_SHARE = Gauge("dpmp_scheduler_share", "Per-miner scheduler time-ratio
 DIFF_DOWNSTREAM = Gauge("dpmp_downstream_difficulty", "Current downstream difficulty")
 ACTIVE_POOL = Gauge("dpmp_active_pool", "Active pool (1=active,0=inactive)", ["pool"])
 
+# Pre-bound label children for per-message / per-tick updates: .labels() does a
+# lookup under the metric's lock on every call, and these label sets are fixed.
+MSG_RX_BY_SIDE = {s: MSG_RX.labels(side=s) for s in ("downstream", "upstreamA", "upstreamB")}
+MSG_TX_BY_SIDE = {s: MSG_TX.labels(side=s) for s in ("downstream", "upstreamA", "upstreamB")}
+ACTIVE_POOL_BY_POOL = {p: ACTIVE_POOL.labels(pool=p) for p in ("A", "B")}
+SHARES_ACCEPTED_BY_POOL = {p: SHARES_ACCEPTED.labels(pool=p) for p in ("A", "B")}
+SHARES_REJECTED_BY_POOL = {p: SHARES_REJECTED.labels(pool=p) for p in ("A", "B")}
+ACCEPTED_DIFFICULTY_SUM_BY_POOL = {p: ACCEPTED_DIFFICULTY_SUM.labels(pool=p) for p in ("A", "B")}
+JOBS_FORWARDED_BY_POOL = {p: JOBS_FORWARDED.labels(pool=p) for p in ("A", "B")}
+SCHEDULER_TIME_SUM_BY_POOL = {p: SCHEDULER_TIME_SUM.labels(pool=p) for p in ("A", "B")}
+SCHEDULER_SHARE_BY_POOL = {p: SCHEDULER_SHARE.labels(pool=p) for p in ("A", "B")}
+
+# Mark `pool` as the active pool in the dpmp_active_pool gauge
+def set_active_pool_gauge(pool: str) -> None:
+    ACTIVE_POOL_BY_POOL["A"].set(1 if pool == "A" else 0)
+    ACTIVE_POOL_BY_POOL["B"].set(1 if pool == "B" else 0)
+
 # Oracle metrics
 ORACLE_HASHRATE = Gauge("dpmp_oracle_hashrate", "Network hashrate from oracle", ["chain", "window"])
 ORACLE_RATIO = Gauge("dpmp_oracle_ratio", "Hashrate ratio (short/baseline)", ["chain"])
@@ -57,6 +88,12 @@ WEIGHTS_OVERRIDE_PATH = None  # set in main() from config path
 ORACLE_MODE_PATH = None       # set in main() from config path
 MAX_CACHED_NOTIFY_AGE_S = 20.0  # don't switch into pool if cached notify older than this
 MAX_CONVERGE_DEVIATION = 0.05 # default max deviation (5%) to trigger urgent pool switch
+POOL_RECONNECT_BACKOFF_S = (5.0, 10.0, 20.0, 40.0, 60.0)  # by consecutive failures; last step repeats
+SCHED_MAX_TICK_S = 1.0  # longest forward_jobs sleeps without a notify/failover wakeup (slider, credits, heartbeat)
+_JOB_OWNER_MAX = 200  # jobids remembered per pool for submit routing (oldest evicted first)
+_INTERNAL_ID_BASE = 9000000  # internal upstream request ids are _INTERNAL_ID_BASE+1, +2, ...
+_SEEN_RESPONSE_IDS_MAX = 500  # (pool_key, id) pairs remembered for upstream response de-dupe
+_SUBMIT_OWNER_MAX = 200  # in-flight submits tracked per session (orphans evicted oldest first)
 
 # Global fleet coordination: track which pool each miner session is on,
 # weighted by each miner's observed hashrate (share difficulty).
@@ -90,9 +127,10 @@ _worker_stats_lock = threading.Lock()
 _worker_stats: dict[str, dict] = {}
 
 # Per-pool latency tracking: time from submit -> result (round-trip)
-# _pool_submit_time[msg_id] = (pool_key, monotonic_timestamp)
+# _pool_submit_time[msg_id] = (monotonic_timestamp, pool_key)
+# (timestamp first so entries order by age with a plain itemgetter key)
 _pool_submit_time_lock = threading.Lock()
-_pool_submit_time: dict[Any, tuple[str, float]] = {}
+_pool_submit_time: dict[Any, tuple[float, str]] = {}
 _pool_latency: dict[str, float] = {"A": 0.0, "B": 0.0}  # latest latency in ms
 
 # Path to worker stats JSON file (set in main())
@@ -301,11 +339,12 @@ def _pool_record_submit_time(msg_id: Any, pool_key: str) -> None:
     """Record the monotonic time when a share was submitted to a pool.
     Called right before sending the share upstream."""
     with _pool_submit_time_lock:
-        _pool_submit_time[msg_id] = (pool_key, time.monotonic())
+        _pool_submit_time[msg_id] = (time.monotonic(), pool_key)
         # Prune old entries (shouldn't happen, but safety)
+        # Keep the newest 250; only the evicted entries need ordering.
+        excess = len(_pool_submit_time) - 250
         if len(_pool_submit_time) > 500:
-            oldest = sorted(_pool_submit_time.items(), key=lambda x: x[1][1])
-            for k, _ in oldest[:250]:
+            for k, _ in nsmallest(excess, _pool_submit_time.items(), key=itemgetter(1)):
                 _pool_submit_time.pop(k, None)
 
 
@@ -316,7 +355,7 @@ def _pool_record_result_time(msg_id: Any) -> None:
         entry = _pool_submit_time.pop(msg_id, None)
     if entry is None:
         return
-    pool_key, submit_mono = entry
+    submit_mono, pool_key = entry
     latency_ms = (time.monotonic() - submit_mono) * 1000.0
     _pool_latency[pool_key] = round(latency_ms, 1)
 
@@ -460,23 +499,79 @@ def _has_recent_en2_hint(miner_ip: str) -> bool:
     _, ts = entry
     return (time.monotonic() - ts) <= _EN2_STRIKE_WINDOW_S
 
+# Last parsed weights override, keyed by the file's (mtime_ns, size, inode).
+# Every session's scheduler reads the override each tick; the file only changes
+# when the slider (or oracle) writes it, so a stat() is enough in between.
+_WEIGHT_OVERRIDE_CACHE: Dict[str, Any] = {"key": None, "val": None}
+
 # Read weight override file if it exists (written by GUI slider)
 def read_weight_override() -> tuple[int, int] | None:
     """Return (wA, wB) from weights_override.json, or None if file missing/invalid."""
     if WEIGHTS_OVERRIDE_PATH is None:
         return None
+    try:
+        st = os.stat(WEIGHTS_OVERRIDE_PATH)
+    except OSError:
+        _WEIGHT_OVERRIDE_CACHE["key"] = None
+        return None
+    key = (st.st_mtime_ns, st.st_size, st.st_ino)
+    if key == _WEIGHT_OVERRIDE_CACHE["key"]:
+        return _WEIGHT_OVERRIDE_CACHE["val"]
+    val = None
     try:
         with open(WEIGHTS_OVERRIDE_PATH, "rb") as f:
             obj = json.loads(f.read())
         wA = int(obj.get("poolA_weight", -1))
         wB = int(obj.get("poolB_weight", -1))
-        if wA < 0 or wB < 0 or (wA == 0 and wB == 0):
-            return None
-        return (wA, wB)
+        if not (wA < 0 or wB < 0 or (wA == 0 and wB == 0)):
+            val = (wA, wB)
     except FileNotFoundError:
         return None
     except Exception:
-        return None
+        val = None
+    _WEIGHT_OVERRIDE_CACHE["key"] = key
+    _WEIGHT_OVERRIDE_CACHE["val"] = val
+    return val
+
+
+def sched_derived(wA: int, wB: int, current_pool: str, slice_s: int, min_switch: int) -> tuple[float, float, float, float, float]:
+    """Scheduler values that depend only on the weights and the current pool.
+
+    Returns (effective_min_switch, targetA, targetB, urgency_threshold, hysteresis).
+    forward_jobs() caches the result and only calls this when (wA, wB, current_pool) changes.
+    """
+    totw = wA + wB
+    if totw > 0:
+        targetA = wA / totw
+        targetB = wB / totw
+    else:
+        targetA, targetB = 0.5, 0.5
+
+    # Scale min_switch by the active pool's target weight.
+    # At 15/85, a full 50s slice on Pool A massively overshoots
+    # (the miner should only spend ~15% of time on A).
+    # Floor of 10s prevents sub-second thrashing.
+    _active_frac = targetA if current_pool == "A" else targetB
+    effective_min_switch = max(float(slice_s), min(float(min_switch), float(min_switch) * _active_frac * 2.0))
+
+    # Scale urgency threshold by minority pool fraction.
+    # At 50/50: threshold = max(0.05, 0.50) = 0.50 -- urgent almost never fires
+    # At 80/20: threshold = max(0.05, 0.20) = 0.20 -- only truly large deviations
+    # At 95/5:  threshold = max(0.05, 0.05) = 0.05 -- tighter at extreme ratios
+    minority_frac = min(targetA, targetB)
+    urgency_threshold = max(MAX_CONVERGE_DEVIATION, minority_frac)
+
+    # Hysteresis: don't switch to the minority pool for tiny
+    # deviations. A 30s slice on the minority pool creates a
+    # large overshoot; only switch when the deficit is big
+    # enough to justify that slice.
+    # At 15/85 on B: minority_frac=0.15, threshold=0.0375
+    #   -- only switch B/A when shareA < 0.1125 (meaningfully behind)
+    # At 50/50: minority_frac=0.50, threshold=0.125
+    #   -- rarely triggers (deviation seldom that large at 50/50)
+    hysteresis = min(minority_frac / 4.0, 0.04)
+
+    return effective_min_switch, targetA, targetB, urgency_threshold, hysteresis
 
 
 def read_oracle_mode(config_auto_balance: bool) -> bool:
@@ -522,25 +617,106 @@ _DEBUG_EVENTS = {
     "job_forwarded_diff_state",
     "downstream_send_notify", "downstream_send_raw",
     "downstream_send_diff", "scheduler_tick",
+    "session_state_sizes",
 }
 
-# Structured logging function
-def log(event: str, **fields: Any) -> None:
+# Would log(event, ...) actually emit?  Lets hot paths skip building
+# expensive diagnostic fields for events that are filtered out anyway.
+def log_enabled(event: str) -> bool:
     # Allowlist/denylist first (highest priority)
     if LOG_ALLOW and event not in LOG_ALLOW:
-        return
+        return False
     if LOG_DENY and event in LOG_DENY:
-        return
+        return False
 
     # Level-based filtering
     if LOG_LEVEL in ("quiet", "off", "none"):
-        return
+        return False
     if LOG_LEVEL in ("info", "warn", "warning", "error"):
         if event in _DEBUG_EVENTS:
+            return False
+    return True
+
+# Log lines are serialized by the caller (fields are captured as they were at
+# the call) but written to stdout by a background thread once it is started,
+# so a slow stdout consumer never stalls the event loop.  If the queue is full
+# the line is dropped and counted rather than blocking the caller.
+_LOG_QUEUE_MAX = 10000
+_LOG_BATCH_MAX = 256  # lines joined into one stdout write
+_log_queue: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=_LOG_QUEUE_MAX)
+_log_writer: Optional[threading.Thread] = None
+_log_dropped = 0  # guarded by _log_dropped_lock: log() may run on several threads
+_log_dropped_lock = threading.Lock()
+
+def _log_write_loop_sync() -> None:
+    """Background thread draining _log_queue to stdout in batches until a None sentinel."""
+    global _log_dropped
+    while True:
+        lines = [_log_queue.get()]
+        while len(lines) < _LOG_BATCH_MAX:
+            try:
+                lines.append(_log_queue.get_nowait())
+            except queue.Empty:
+                break
+        stop = None in lines
+        if stop:
+            lines = [x for x in lines if x is not None]
+        with _log_dropped_lock:
+            n, _log_dropped = _log_dropped, 0
+        if n and log_enabled("log_dropped"):
+            lines.append(json.dumps({"ts": now_utc(), "event": "log_dropped", "n": n}, separators=(",", ":")))
+        if lines:
+            try:
+                sys.stdout.write("\n".join(lines) + "\n")
+                sys.stdout.flush()
+            except Exception:
+                pass
+        if stop:
             return
 
+def start_log_writer() -> None:
+    global _log_writer
+    if _log_writer is None:
+        _log_writer = threading.Thread(target=_log_write_loop_sync, name="dpmp-log-writer", daemon=True)
+        _log_writer.start()
+
+# Flush queued lines and go back to writing directly (process exit)
+def stop_log_writer(timeout: float = 2.0) -> None:
+    global _log_writer
+    t = _log_writer
+    if t is None:
+        return
+    try:
+        _log_queue.put(None, timeout=timeout)
+        t.join(timeout)
+    except queue.Full:
+        pass
+    _log_writer = None
+
+# Structured logging function
+def log(event: str, **fields: Any) -> None:
+    global _log_dropped
+    if not log_enabled(event):
+        return
+
     rec = {"ts": now_utc(), "event": event, **fields}
-    print(json.dumps(rec, separators=(",", ":"), ensure_ascii=False), flush=True)
+    # Same compact UTF-8 output either way; orjson is just much cheaper per line.
+    line = None
+    if orjson is not None:
+        try:
+            line = orjson.dumps(rec, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except TypeError:
+            pass
+    if line is None:
+        line = json.dumps(rec, separators=(",", ":"), ensure_ascii=False)
+    if _log_writer is None:
+        print(line, flush=True)
+        return
+    try:
+        _log_queue.put_nowait(line)
+    except queue.Full:
+        with _log_dropped_lock:
+            _log_dropped += 1
 
 # JSON load/dump helpers with orjson if available
 def loads_json(b: bytes) -> Dict[str, Any]:
@@ -556,9 +732,14 @@ def dumps_json(obj: Dict[str, Any]) -> bytes:
         obj = dict(obj)
         obj["error"] = None
     if orjson is not None:
-        return orjson.dumps(obj) + b"\n"
+        # OPT_APPEND_NEWLINE writes the terminator in the same buffer (no "+ b'\n'" copy).
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
     return (json.dumps(obj, separators=(",", ":"), ensure_ascii=False) + "\n").encode("utf-8")
 
+# Pre-serialized mining.set_difficulty line; only the integer difficulty varies,
+# so "%d" formatting replaces a dict build + JSON encode per difficulty change.
+SET_DIFFICULTY_TMPL = b'{"method":"mining.set_difficulty","params":[%d]}\n'
+
 # Sanitize downstream notification (remove JSON-RPC 2.0 fields)
 def sanitize_downstream_notification(msg: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -574,6 +755,23 @@ def sanitize_downstream_notification(msg: Dict[str, Any]) -> Dict[str, Any]:
     m.pop("id", None)
     return m
 
+# Downstream line for a parsed pool notify with clean_jobs forced to true
+def clean_notify_line(msg: Dict[str, Any]) -> Optional[bytes]:
+    """
+    Returns the sanitized, newline-terminated mining.notify line with its last
+    param (clean_jobs) set to true, padding params to 9 if the pool sent fewer.
+    Returns None if msg is not a notify with params.  Mutates msg["params"].
+    """
+    if not isinstance(msg, dict) or msg.get("method") != "mining.notify":
+        return None
+    params = msg.get("params")
+    if not isinstance(params, list) or len(params) < 1:
+        return None
+    while len(params) < 9:
+        params.append(None)
+    params[-1] = True
+    return dumps_json(sanitize_downstream_notification(msg))
+
 # Extract worker name from miner 'user' string
 def extract_worker_name(user: str) -> str:
     """
@@ -627,6 +825,8 @@ class AppCfg:
     poolB: PoolCfg
     sched: SchedulerCfg
     downstream_diff: dict
+    diff_notify_delay_s: float = 0.0  # pause between set_difficulty and notify; 0 = same batch
+    chains_valid: bool = False  # one BTC + one BCH pool (oracle can run); set by load_config
 
 # Load configuration from JSON file
 def load_config(path: str) -> AppCfg:
@@ -752,29 +952,69 @@ def load_config(path: str) -> AppCfg:
         min_switch_seconds=raw_min_switch, slice_seconds=raw_slice,
         wA=wA, wB=wB)
 
+    # Optional pause between a new set_difficulty and the notify that follows it,
+    # for miner firmware that applies the difficulty late. Off (0) by default.
+    downstream_diff = dict(cfg.get("downstream_diff", {}))
+    try:
+        diff_notify_delay_s = max(0.0, float(downstream_diff.get("notify_delay_ms", 0) or 0)) / 1000.0
+    except (TypeError, ValueError):
+        log("config_invalid_notify_delay", raw=downstream_diff.get("notify_delay_ms"), corrected=0)
+        diff_notify_delay_s = 0.0
+
+    poolA, poolB = pool("A"), pool("B")
     return AppCfg(
         listen_host=str(listen_host),
         listen_port=int(listen_port),
         metrics_enabled=bool(metrics_enabled),
         metrics_host=str(metrics_host),
         metrics_port=int(metrics_port),
-        poolA=pool("A"),
-        poolB=pool("B"),
+        poolA=poolA,
+        poolB=poolB,
         sched=SchedulerCfg(wA=wA, wB=wB, min_switch_seconds=raw_min_switch, slice_seconds=raw_slice,
                            auto_balance=auto_balance, auto_balance_max_deviation=auto_balance_max_deviation,
                            oracle_url=oracle_url, oracle_poll_seconds=oracle_poll_seconds),
-        downstream_diff=dict(cfg.get("downstream_diff", {})),
+        downstream_diff=downstream_diff,
+        diff_notify_delay_s=diff_notify_delay_s,
+        chains_valid=sorted([poolA.chain, poolB.chain]) == ["BCH", "BTC"],
     )
 
+# Optional SO_BUSY_POLL budget (microseconds) for miner/pool sockets; 0 = off.
+# Busy polling trades CPU for lower small-message latency, so it is opt-in
+# (leave it off on low-end hosts such as a Raspberry Pi).  Raising it above
+# net.core.busy_read needs CAP_NET_ADMIN; failures are logged and ignored.
+try:
+    SOCKET_BUSY_POLL_US = max(0, int(os.environ.get("DPMP_BUSY_POLL_US", "0") or 0))
+except ValueError:
+    SOCKET_BUSY_POLL_US = 0
+_SO_BUSY_POLL = getattr(socket, "SO_BUSY_POLL", 46)  # Linux value; not exported by every Python build
+
+# Latency tuning for a miner/pool stream (Stratum is small request/response lines)
+def tune_socket(writer: asyncio.StreamWriter, side: str) -> None:
+    sock = writer.get_extra_info("socket")
+    if sock is None:
+        return
+    try:
+        # asyncio normally sets this already; make it explicit for every loop implementation.
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except (OSError, AttributeError):
+        pass
+    if SOCKET_BUSY_POLL_US > 0:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, _SO_BUSY_POLL, SOCKET_BUSY_POLL_US)
+        except OSError as e:
+            log("socket_busy_poll_failed", side=side, busy_poll_us=SOCKET_BUSY_POLL_US, err=str(e))
+
 # Async read/write helpers with Prometheus metrics
 async def iter_lines(reader: asyncio.StreamReader, side: str):
+    rx = MSG_RX_BY_SIDE.get(side) or MSG_RX.labels(side=side)
     while True:
         line = await reader.readline()
         if not line:
             return
-        if not line.strip():
+        # isspace() checks in place; strip() would copy every line just to test it.
+        if line.isspace():
             continue
-        MSG_RX.labels(side=side).inc()
+        rx.inc()
         yield line
 
 # 
@@ -782,7 +1022,9 @@ async def write_line(writer: asyncio.StreamWriter, data: bytes, side: str):
     try:
         # Downstream miners expect Stratum v1 notifications WITHOUT JSON-RPC 2.0 fields.
         # Ensure we never send {'jsonrpc':'2.0', ...} or id:null on mining.notify.
-        if side == "downstream":
+        # Only lines that can be a notify are re-parsed; submit responses, diff and
+        # extranonce lines are written as-is without a JSON round-trip.
+        if side == "downstream" and b'"mining.notify"' in data:
             try:
                 msg = loads_json(data)
                 if isinstance(msg, dict) and msg.get("method") == "mining.notify":
@@ -792,10 +1034,14 @@ async def write_line(writer: asyncio.StreamWriter, data: bytes, side: str):
                 pass
         writer.write(data)
         await writer.drain()
-        MSG_TX.labels(side=side).inc()
+        (MSG_TX_BY_SIDE.get(side) or MSG_TX.labels(side=side)).inc()
 
         # Lightweight visibility into what we actually send.
         # Log bytes + a small safe preview (helps confirm miner is receiving what we expect).
+        # These are debug events: skip the peer lookup and decode when filtered.
+        tx_event = "downstream_tx" if side == "downstream" else "upstream_tx"
+        if not log_enabled(tx_event):
+            return
         peer = writer.get_extra_info("peername")
         preview = ""
         try:
@@ -808,9 +1054,35 @@ async def write_line(writer: asyncio.StreamWriter, data: bytes, side: str):
             preview = "<decode_error>"
 
         if side == "downstream":
-            log("downstream_tx", peer=str(peer), bytes=len(data), preview=preview)
+            log(tx_event, peer=str(peer), bytes=len(data), preview=preview)
         else:
-            log("upstream_tx", peer=str(peer), side=side, bytes=len(data), preview=preview)
+            log(tx_event, peer=str(peer), side=side, bytes=len(data), preview=preview)
+
+    except Exception as e:
+        peer = writer.get_extra_info("peername")
+        log("write_failed", peer=str(peer), side=side, err=str(e))
+        raise
+
+# Write several already-serialized lines with one transport call + one drain
+async def write_lines(writer: asyncio.StreamWriter, lines: list[bytes], side: str):
+    """Batched counterpart of write_line() for messages that must go out back-to-back
+    (e.g. set_extranonce -> set_difficulty -> notify).  TCP keeps them in order, and
+    the miner processes them in order, so no await is needed between them.
+    Lines must already be sanitized and newline-terminated."""
+    try:
+        writer.writelines(lines)
+        await writer.drain()
+        (MSG_TX_BY_SIDE.get(side) or MSG_TX.labels(side=side)).inc(len(lines))
+
+        tx_event = "downstream_tx" if side == "downstream" else "upstream_tx"
+        if not log_enabled(tx_event):
+            return
+        peer = writer.get_extra_info("peername")
+        nbytes = sum(len(b) for b in lines)
+        if side == "downstream":
+            log(tx_event, peer=str(peer), bytes=nbytes, lines=len(lines))
+        else:
+            log(tx_event, peer=str(peer), side=side, bytes=nbytes, lines=len(lines))
 
     except Exception as e:
         peer = writer.get_extra_info("peername")
@@ -890,11 +1162,10 @@ async def oracle_poll_loop(cfg: AppCfg):
 
     # Figure out which pool is BTC and which is BCH from config.
     # The oracle needs this to apply the correct weights to the correct pool.
-    pool_chain = {}   # "A" -> "BTC" or "BCH"
-    pool_chain["A"] = getattr(cfg.poolA, "chain", "").upper()
-    pool_chain["B"] = getattr(cfg.poolB, "chain", "").upper()
+    # (chains are upper-cased and validated once by load_config)
+    pool_chain = {"A": cfg.poolA.chain, "B": cfg.poolB.chain}   # "A" -> "BTC" or "BCH"
 
-    if sorted([pool_chain["A"], pool_chain["B"]]) != ["BCH", "BTC"]:
+    if not cfg.chains_valid:
         log("oracle_disabled_bad_chain_config",
             poolA_chain=pool_chain["A"], poolB_chain=pool_chain["B"],
             reason="auto_balance requires one BTC pool and one BCH pool")
@@ -1111,8 +1382,39 @@ def _calc_hashrate_pair(difficulty: float, ts_latest: int,
 
 # End Hashrate Oracle 
 
+# Raised when a session task returns, so run()'s TaskGroup cancels the siblings
+class _SessionTaskDone(Exception):
+    pass
+
+
+async def _end_session_when_done(coro) -> None:
+    await coro
+    raise _SessionTaskDone()
+
+
 # Proxy session handling a single miner connection and two upstream pools
 class ProxySession:
+    # Fixed attribute layout: sessions are long-lived and touched on every
+    # message. Any new per-session attribute must be listed here.
+    __slots__ = (
+        "cfg", "sid", "miner_r", "miner_w", "rA", "wA", "rB", "wB", "pool_w", "up_q",
+        "worker", "submit_user_A", "submit_user_B",
+        "miner_ready", "authorize_id", "subscribe_id", "configure_id", "id_gen",
+        "latest_notify_raw", "latest_notify_clean", "latest_jobid", "notify_seq", "last_notify_mono",
+        "extranonce1", "extranonce2_size", "latest_diff",
+        "last_downstream_diff_by_pool", "last_downstream_extranonce", "downstream_setup_lock",
+        "last_downstream_en1", "last_downstream_en2s", "last_downstream_extranonce_pool",
+        "active_pool", "job_owner_A", "job_owner_B", "last_forwarded_jobid", "last_forwarded_pool",
+        "submit_pending", "seen_upstream_response_ids", "handshake_pool",
+        "accepted_diff_sum", "submit_fp_last", "submit_fp_max", "submit_fp_ttl_s",
+        "sched", "original_weights", "last_switch_mono",
+        "_internal_next_id", "_internal_subscribe_id", "_internal_authorize_id",
+        "expect_raw_subscribe", "raw_subscribe_forwarded_pool",
+        "pool_alive", "pool_fail_count", "pool_last_fail_mono", "pool_reconnect_task", "notify_event",
+        # Set lazily (read via getattr(..., default)).
+        "_lowdiff_suppressed", "_last_effective_weights", "_last_scheduler_tick_log", "_last_en2_skip_log",
+    )
+
     def __init__(self, cfg: AppCfg, miner_r: asyncio.StreamReader, miner_w: asyncio.StreamWriter, sid: str):
         self.cfg = cfg
         self.sid = sid  # downstream session id (peer)
@@ -1128,6 +1430,11 @@ class ProxySession:
         self.wB: Optional[asyncio.StreamWriter] = None
 
         self.worker: str = ""
+        # Upstream submit user per pool ("wallet.worker"), rebuilt only when the
+        # worker name changes (see update_submit_users()).
+        self.submit_user_A: Optional[str] = None
+        self.submit_user_B: Optional[str] = None
+        self.update_submit_users()
         self.miner_ready = asyncio.Event()
         self.authorize_id: Any = None
         self.subscribe_id: Any = None
@@ -1135,6 +1442,9 @@ class ProxySession:
         self.id_gen = itertools.count(1)
 
         self.latest_notify_raw: Dict[str, Optional[bytes]] = {"A": None, "B": None}
+        # Downstream-ready form of latest_notify_raw (clean_notify_line()), built once
+        # when the notify arrives so forwarding/resending it needs no JSON work.
+        self.latest_notify_clean: Dict[str, Optional[bytes]] = {"A": None, "B": None}
         self.latest_jobid: Dict[str, Optional[str]] = {"A": None, "B": None}
         self.notify_seq: Dict[str, int] = {"A": 0, "B": 0}
         self.last_notify_mono: Dict[str, float | None] = {"A": None, "B": None}
@@ -1177,29 +1487,34 @@ class ProxySession:
         except Exception:
             pass
 
-        self.job_owner: Dict[tuple, str] = {}  # key=(pool_key, jobid)
+        # Jobids forwarded downstream, per pool (insertion-ordered presence sets).
+        # Bounded at _JOB_OWNER_MAX per pool; see record_job_owner().
+        self.job_owner_A: OrderedDict[str, None] = OrderedDict()
+        self.job_owner_B: OrderedDict[str, None] = OrderedDict()
 
         self.last_forwarded_jobid: str | None = None
 
         self.last_forwarded_pool: str | None = None
-        self.submit_owner: Dict[Any, str] = {}
+        # In-flight submits: miner id -> (pool_key, downstream diff at submit time).
+        self.submit_pending: Dict[Any, tuple[str, float]] = {}
         # per-pool (pool_key,id) de-dupe to prevent collisions between pools
-        self.seen_upstream_response_ids = set()
+        # Insertion-ordered set: oldest (pool_key, id) pairs are evicted at insert time.
+        self.seen_upstream_response_ids: OrderedDict[tuple, None] = OrderedDict()
         self.handshake_pool: str | None = None  # selected pool for subscribe/authorize handshake responses
-        # de-dupe upstream responses (subscribe/authorize collisions)
-        self.submit_diff: Dict[Any, float] = {}
         self.accepted_diff_sum: Dict[str, float] = {"A": 0.0, "B": 0.0}
         # Deduplicate submits to avoid upstream "Duplicate share" when miners retry submits.
-        # key: pool -> {fingerprint: last_seen_monotonic}
-        self.submit_fp_last: Dict[str, Dict[tuple, float]] = {"A": {}, "B": {}}
+        # key: pool -> {fingerprint: first_seen_monotonic}, oldest first, so TTL
+        # expiry and the size cap only ever pop from the front.
+        self.submit_fp_last: Dict[str, OrderedDict[str, float]] = {"A": OrderedDict(), "B": OrderedDict()}
         self.submit_fp_max: int = 512
         self.submit_fp_ttl_s: float = 45.0
 
         self.sched = RatioScheduler(cfg.sched.wA, cfg.sched.wB)
         # Internal upstream bootstrap (subscribe/auth) so both pools produce notify,
         # even if the miner never sends subscribe/authorize.
-        self._internal_next_id: int = 9000000
-        self._internal_ids: set[int] = set()
+        # Internal ids are handed out consecutively by next_internal_id(), so
+        # "is this one of ours?" is a range check (see is_internal_id()).
+        self._internal_next_id: int = _INTERNAL_ID_BASE
         self._internal_subscribe_id: Dict[str, int] = {}   # pool_key -> id
         self._internal_authorize_id: Dict[str, int] = {}   # pool_key -> id
 
@@ -1209,6 +1524,10 @@ class ProxySession:
         #             Set back to True when reconnect succeeds.
         self.pool_alive: Dict[str, bool] = {"A": True, "B": True}
 
+        # notify_event: wakes forward_jobs() when a pool sends a new notify or a
+        #               pool_alive transition happens, instead of polling.
+        self.notify_event = asyncio.Event()
+
         # pool_fail_count: consecutive reconnect failures (drives exponential backoff).
         #                  Reset to 0 on successful reconnect.
         self.pool_fail_count: Dict[str, int] = {"A": 0, "B": 0}
@@ -1242,11 +1561,23 @@ class ProxySession:
             return
         await write_line(w, raw, f"upstream{pool_key}")
 
+    # Remember which pool a forwarded jobid belongs to (for submit routing)
+    def record_job_owner(self, pool_key: str, jid: Any) -> None:
+        d = self.job_owner_A if pool_key == "A" else self.job_owner_B
+        d[jid] = None
+        d.move_to_end(jid)
+        if len(d) > _JOB_OWNER_MAX:
+            d.popitem(last=False)
+
     # Get next internal id for subscribe/authorize bootstrap
     def next_internal_id(self) -> int:
         self._internal_next_id += 1
         return self._internal_next_id
 
+    # True if a response id belongs to a request we generated internally
+    def is_internal_id(self, mid: Any) -> bool:
+        return isinstance(mid, int) and _INTERNAL_ID_BASE < mid <= self._internal_next_id
+
     # Bootstrap pool connection with subscribe/authorize
     async def bootstrap_pool(self, pcfg: PoolCfg, is_reconnect: bool = False) -> None:
         """Internal subscribe/auth to ensure pool emits notify and we can cache jobs.
@@ -1299,7 +1630,6 @@ class ProxySession:
 
         try:
             sid_sub = self.next_internal_id()
-            self._internal_ids.add(sid_sub)
             self._internal_subscribe_id[pcfg.key] = sid_sub
             sub = {"id": sid_sub, "method": "mining.subscribe", "params": ["dpmpv2/1.0"]}
             await self.send_upstream(pcfg.key, sub)
@@ -1309,7 +1639,6 @@ class ProxySession:
             # were getting "Worker Mismatch" from Bassin.
             # so instead of bootstrap then subscribe, we just subscribe which seems to be enough 
             #aid = self.next_internal_id()
-            #self._internal_ids.add(aid)
             #self._internal_authorize_id[pcfg.key] = aid
             #user = f"{pcfg.wallet}.dpmp_bootstrap" if pcfg.wallet else "dpmp_bootstrap"
             #auth = {"id": aid, "method": "mining.authorize", "params": [user, "x"]}
@@ -1322,6 +1651,7 @@ class ProxySession:
     async def connect_pool(self, pcfg: PoolCfg, is_reconnect: bool = False) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
         log("pool_connecting", key=pcfg.key, pool=pcfg.name, host=pcfg.host, port=pcfg.port)
         r, w = await asyncio.open_connection(pcfg.host, pcfg.port)
+        tune_socket(w, f"upstream{pcfg.key}")
         CONN_UPSTREAM.labels(pool=pcfg.key).inc()
         log("pool_connected", key=pcfg.key, pool=pcfg.name, host=pcfg.host, port=pcfg.port)
 
@@ -1332,15 +1662,24 @@ class ProxySession:
             to_flush = [raw for (raw, tag) in q if tag == pcfg.key]
             keep = [(raw, tag) for (raw, tag) in q if tag != pcfg.key]
             if to_flush:
+                # Queued entries are dumps_json() output (already newline-terminated),
+                # so push them to the transport in one call and drain once.
                 log("send_upstream_flush_start", sid=self.sid, pool=pcfg.key, qlen=len(to_flush))
-                for raw in to_flush:
-                    await write_line(w, raw, f"upstream{pcfg.key}")
-                log("send_upstream_flush_done", sid=self.sid, pool=pcfg.key)
+                await write_lines(w, to_flush, f"upstream{pcfg.key}")
+                log("send_upstream_flush_done", sid=self.sid, pool=pcfg.key,
+                    bytes=sum(len(raw) for raw in to_flush))
             self.up_q[pcfg.key] = keep
         
         await self.bootstrap_pool(pcfg, is_reconnect=is_reconnect)
         return r, w
 
+    # Precompute the upstream submit user for each pool (None = keep miner's user)
+    def update_submit_users(self) -> None:
+        wA = self.cfg.poolA.wallet
+        wB = self.cfg.poolB.wallet
+        self.submit_user_A = f"{wA}.{self.worker}" if wA else None
+        self.submit_user_B = f"{wB}.{self.worker}" if wB else None
+
     # Rewrite authorize message to use configured wallet and extracted worker name
     def rewrite_authorize(self, pcfg: PoolCfg, msg: Dict[str, Any]) -> Dict[str, Any]:
         params = msg.get("params") or []
@@ -1349,8 +1688,13 @@ class ProxySession:
         # Only learn/overwrite worker name when miner_user is non-empty.
         # This prevents autoauthorize (which may start with empty/unknown user) from clobbering
         # an already-known worker name.
+        # Authorize is rewritten once per pool, so only rebuild the cached
+        # submit users when the worker name actually changes.
         if miner_user.strip():
-            self.worker = extract_worker_name(miner_user)
+            worker = extract_worker_name(miner_user)
+            if worker != self.worker:
+                self.worker = worker
+                self.update_submit_users()
 
         pw = str(params[1]) if len(params) >= 2 else "x"
         worker = (self.worker or "worker").strip() or "worker"
@@ -1401,15 +1745,21 @@ class ProxySession:
         # Miner-compat: force integer difficulty downstream (avoid fractional VarDiff diffs).
         # IMPORTANT: return an int so JSON params are [756] not [756.0] (some miners ignore float diffs).
 
+        # v is already a float here; only inf/nan can fail the conversion.
         try:
-            v = int(float(v) + 0.999999)  # ceil without math import
-        except Exception:
+            v = ceil(v)
+        except (OverflowError, ValueError):
             pass
 
         return v
 
     # Send extranonce1 and extranonce2_size downstream if changed
-    async def maybe_send_downstream_extranonce(self, pool_key: str):
+    # If `out` is given, the serialized line is appended to it instead of written,
+    # so the caller can batch it with other setup messages (see write_lines());
+    # that caller must already hold downstream_setup_lock, and passes `pending`, which
+    # it hands to commit_downstream_setup() once the batch has actually been written.
+    async def maybe_send_downstream_extranonce(self, pool_key: str, out: list[bytes] | None = None,
+                                               pending: dict | None = None):
         # If we already raw-forwarded the pool's subscribe result,
         # do NOT re-send extranonce (pool-agnostic safety).
         # The miner already received the extranonce inside the subscribe response.
@@ -1444,54 +1794,72 @@ class ProxySession:
                 en1=en1, en2s=en2s)
             return
 
-        async with self.downstream_setup_lock:
-            new_en1 = str(en1)
-            new_en2s = int(en2s)
-            
-            # Force send if the miner's current extranonce context is for a
-            # DIFFERENT pool than the one we're switching to.  This is the only
-            # time we truly need to send mining.set_extranonce.
-            # When the same non-handshake pool sends a new notify with the same
-            # extranonce, we skip (no redundant sends that would crash NerdAxe).
-            handshake = getattr(self, "handshake_pool", None)
-            last_en_pool = getattr(self, "last_downstream_extranonce_pool", None)
-            force_send = (last_en_pool is not None and last_en_pool != pool_key)
+        new_en1 = str(en1)
+        new_en2s = int(en2s)
+
+        # Force send if the miner's current extranonce context is for a
+        # DIFFERENT pool than the one we're switching to.  This is the only
+        # time we truly need to send mining.set_extranonce.
+        # When the same non-handshake pool sends a new notify with the same
+        # extranonce, we skip (no redundant sends that would crash NerdAxe).
+        handshake = getattr(self, "handshake_pool", None)
+        last_en_pool = getattr(self, "last_downstream_extranonce_pool", None)
+        force_send = (last_en_pool is not None and last_en_pool != pool_key)
+
+        # Debug logging to see why force_send might be False
+        log("downstream_extranonce_check", sid=self.sid, pool=pool_key,
+            handshake=handshake, last_en_pool=last_en_pool, force_send=force_send,
+            new_en1=new_en1, new_en2s=new_en2s,
+            last_en1=self.last_downstream_en1, last_en2s=self.last_downstream_en2s)
+
+        # Only skip if NOT force_send AND values unchanged.
+        # This is the steady-state path, so it never touches the lock
+        # (the standalone send below re-checks under the lock; batch callers hold it).
+        if not force_send and self.last_downstream_en1 == new_en1 and self.last_downstream_en2s == new_en2s:
+            log("downstream_extranonce_skip_nochange", sid=self.sid, pool=pool_key,
+                en1=new_en1, en2s=new_en2s,
+                last_en1=str(self.last_downstream_en1), last_en2s=str(self.last_downstream_en2s),
+                force_send=force_send, handshake=handshake, last_en_pool=last_en_pool)
+            return
 
-            # Debug logging to see why force_send might be False
-            log("downstream_extranonce_check", sid=self.sid, pool=pool_key,
-                handshake=handshake, last_en_pool=last_en_pool, force_send=force_send,
-                new_en1=new_en1, new_en2s=new_en2s,
-                last_en1=self.last_downstream_en1, last_en2s=self.last_downstream_en2s)
-            
-            # Only skip if NOT force_send AND values unchanged
-            if not force_send and self.last_downstream_en1 == new_en1 and self.last_downstream_en2s == new_en2s:
+        # If extranonce2_size is changing, some miners (e.g., Braiins BM-101)
+        # may disconnect after receiving mining.set_extranonce with a different
+        # en2_size.  We pre-write a handshake hint so that IF the miner
+        # disconnects, the next session lands on the correct pool automatically.
+        # Miners flagged via the strike system never reach this code because
+        # forward_jobs blocks the pool switch entirely for them.
+        if (self.last_downstream_en2s is not None
+                and new_en2s != self.last_downstream_en2s):
+            try:
+                peer = self.miner_w.get_extra_info("peername")
+                if peer:
+                    _next_handshake_pool[peer[0]] = (pool_key, time.monotonic())
+            except Exception:
+                pass
+            log("downstream_extranonce_size_change_hint", sid=self.sid,
+                pool=pool_key, old_en2s=self.last_downstream_en2s,
+                new_en2s=new_en2s, new_en1=new_en1,
+                reason="en2_size changing, hint written for potential reconnect")
+
+        # Send the extranonce.  Only the write + "last sent" bookkeeping is
+        # serialized against maybe_send_downstream_diff().
+        msg = {"method": "mining.set_extranonce", "params": [new_en1, new_en2s]}
+        if out is not None:
+            out.append(dumps_json(msg))
+            if pending is not None:
+                pending["extranonce"] = {"pool": pool_key, "extranonce1": new_en1, "extranonce2_size": new_en2s,
+                                         "force_send": force_send, "handshake": handshake}
+            return
+        async with self.downstream_setup_lock:
+            # Re-check under the lock: the post-auth sync and forward_notify() can both
+            # pass the check above while the other is still draining the same message,
+            # and a duplicate set_extranonce is exactly what crashes NerdAxe firmware.
+            if (self.last_downstream_extranonce_pool in (None, pool_key)
+                    and self.last_downstream_en1 == new_en1 and self.last_downstream_en2s == new_en2s):
                 log("downstream_extranonce_skip_nochange", sid=self.sid, pool=pool_key,
-                    en1=new_en1, en2s=new_en2s,
-                    last_en1=str(self.last_downstream_en1), last_en2s=str(self.last_downstream_en2s),
-                    force_send=force_send, handshake=handshake, last_en_pool=last_en_pool)
+                    en1=new_en1, en2s=new_en2s, force_send=force_send, handshake=handshake,
+                    last_en_pool=self.last_downstream_extranonce_pool, rechecked=True)
                 return
-
-            # If extranonce2_size is changing, some miners (e.g., Braiins BM-101)
-            # may disconnect after receiving mining.set_extranonce with a different
-            # en2_size.  We pre-write a handshake hint so that IF the miner
-            # disconnects, the next session lands on the correct pool automatically.
-            # Miners flagged via the strike system never reach this code because
-            # forward_jobs blocks the pool switch entirely for them.
-            if (self.last_downstream_en2s is not None
-                    and new_en2s != self.last_downstream_en2s):
-                try:
-                    peer = self.miner_w.get_extra_info("peername")
-                    if peer:
-                        _next_handshake_pool[peer[0]] = (pool_key, time.monotonic())
-                except Exception:
-                    pass
-                log("downstream_extranonce_size_change_hint", sid=self.sid,
-                    pool=pool_key, old_en2s=self.last_downstream_en2s,
-                    new_en2s=new_en2s, new_en1=new_en1,
-                    reason="en2_size changing, hint written for potential reconnect")
-
-            # Send the extranonce
-            msg = {"method": "mining.set_extranonce", "params": [new_en1, new_en2s]}
             try:
                 await write_line(self.miner_w, dumps_json(msg), "downstream")
             except Exception as e:
@@ -1502,31 +1870,98 @@ class ProxySession:
             self.last_downstream_en1 = new_en1
             self.last_downstream_en2s = new_en2s
             self.last_downstream_extranonce_pool = pool_key
-            log("downstream_extranonce_set", sid=self.sid, pool=pool_key, extranonce1=new_en1, extranonce2_size=new_en2s,
-                force_send=force_send, handshake=handshake)
+        log("downstream_extranonce_set", sid=self.sid, pool=pool_key, extranonce1=new_en1, extranonce2_size=new_en2s,
+            force_send=force_send, handshake=handshake)
 
-    # Send downstream difficulty if changed
-    async def maybe_send_downstream_diff(self, pool_key: str, force: bool = False) -> bool:
+    # Send downstream difficulty if changed (or append it to `out`, as above)
+    async def maybe_send_downstream_diff(self, pool_key: str, force: bool = False,
+                                         out: list[bytes] | None = None,
+                                         pending: dict | None = None) -> bool:
         # If a pool is disabled by scheduler weights, never send its difficulty downstream.
         # Prevents diff flips from the non-active pool (poisoning).
         if pool_key == "A" and self.cfg.sched.wA <= 0:
             return False
         if pool_key == "B" and self.cfg.sched.wB <= 0:
             return False
+        dd = self.downstream_diff_policy(pool_key)
+        if dd is None:
+            return False
+        last_dd = self.last_downstream_diff_by_pool.get(pool_key)
+        if (not force) and last_dd is not None and dd == last_dd:
+            return False
+        dd_sent = int(dd) if dd is not None else dd
+        log("downstream_send_diff", sid=self.sid, pool=pool_key, payload={"method":"mining.set_difficulty","params":[dd_sent]})
+        if out is not None:
+            out.append(SET_DIFFICULTY_TMPL % dd_sent)
+            if pending is not None:
+                pending["diff"] = {"pool": pool_key, "diff": dd, "diff_sent": dd_sent}
+            return True
         async with self.downstream_setup_lock:
-            dd = self.downstream_diff_policy(pool_key)
-            if dd is None:
-                return False
-            last_dd = self.last_downstream_diff_by_pool.get(pool_key)
-            if (not force) and last_dd is not None and dd == last_dd:
+            # Re-check under the lock (see maybe_send_downstream_extranonce()).
+            if (not force) and self.last_downstream_diff_by_pool.get(pool_key) == dd_sent:
                 return False
-            dd_sent = int(dd) if dd is not None else dd
+            await write_line(self.miner_w, SET_DIFFICULTY_TMPL % dd_sent, "downstream")
             self.last_downstream_diff_by_pool[pool_key] = dd_sent
-            DIFF_DOWNSTREAM.set(dd_sent)
-            log("downstream_send_diff", sid=self.sid, pool=pool_key, payload={"method":"mining.set_difficulty","params":[dd_sent]})
-            await write_line(self.miner_w, dumps_json({"method": "mining.set_difficulty", "params": [dd_sent]}), "downstream")
-            log("downstream_diff_set", sid=self.sid, pool=pool_key, diff=dd, diff_sent=dd_sent)
-            return True
+        DIFF_DOWNSTREAM.set(dd_sent)
+        log("downstream_diff_set", sid=self.sid, pool=pool_key, diff=dd, diff_sent=dd_sent)
+        return True
+
+    # Record batched setup messages (see the `pending` arg above) as delivered.
+    # Only called after the batch write succeeded, so a failed write never leaves
+    # us believing the miner has an extranonce/diff it did not receive.
+    def commit_downstream_setup(self, pending: dict) -> None:
+        en = pending.get("extranonce")
+        if en is not None:
+            self.last_downstream_en1 = en["extranonce1"]
+            self.last_downstream_en2s = en["extranonce2_size"]
+            self.last_downstream_extranonce_pool = en["pool"]
+            log("downstream_extranonce_set", sid=self.sid, batched=True, **en)
+        dd = pending.get("diff")
+        if dd is not None:
+            self.last_downstream_diff_by_pool[dd["pool"]] = dd["diff_sent"]
+            DIFF_DOWNSTREAM.set(dd["diff_sent"])
+            log("downstream_diff_set", sid=self.sid, batched=True, **dd)
+        pending.clear()
+
+    # Forward a pool's notify together with the extranonce/diff context it needs
+    async def forward_notify(self, pool_key: str, raw: bytes, *, force_diff: bool) -> Optional[bool]:
+        """Send extranonce -> diff -> notify for pool_key to the miner as one ordered batch.
+        Uses the prebuilt clean_jobs=True notify when there is one (returns True),
+        otherwise sends the setup lines followed by raw as-is (returns False).
+        Returns None, sending nothing, if the setup lines could not be built: a notify
+        without its extranonce/diff context is worse than skipping it. Write errors
+        propagate to the caller.
+        With downstream_diff.notify_delay_ms set, a new diff is written on its own and
+        the notify follows after that pause (still under downstream_setup_lock).
+        """
+        bufs: list[bytes] = []
+        pending: dict = {}
+        line = self.latest_notify_clean.get(pool_key)
+        async with self.downstream_setup_lock:
+            # Decide what to send while holding the lock, so a concurrent standalone
+            # maybe_send_downstream_*() can't deliver the same setup message twice.
+            try:
+                await self.maybe_send_downstream_extranonce(pool_key, out=bufs, pending=pending)
+                await self.maybe_send_downstream_diff(pool_key, force=force_diff, out=bufs, pending=pending)
+            except Exception as e:
+                log("notify_clean_force_error", sid=self.sid, pool=pool_key, err=str(e))
+                return None
+            if "diff" in pending and self.cfg.diff_notify_delay_s > 0:
+                await write_lines(self.miner_w, bufs, "downstream")
+                self.commit_downstream_setup(pending)
+                bufs.clear()
+                await asyncio.sleep(self.cfg.diff_notify_delay_s)
+            if line is not None:
+                bufs.append(line)
+                await write_lines(self.miner_w, bufs, "downstream")
+                self.commit_downstream_setup(pending)
+                return True
+            # Not a rewritable notify: send it as-is (write_line sanitizes it).
+            if bufs:
+                await write_lines(self.miner_w, bufs, "downstream")
+                self.commit_downstream_setup(pending)
+            await write_line(self.miner_w, raw, "downstream")
+            return False
 
     # Resend latest notify as clean (isCleanJob=true)
     async def resend_active_notify_clean(self, pool_key: str, reason: str):
@@ -1539,45 +1974,264 @@ class ProxySession:
             log("resend_notify_skipped_no_cached", sid=self.sid, pool=pool_key, reason=reason)
             return
         try:
-            nm = loads_json(raw)
-            if nm.get("method") == "mining.notify":
-                params = nm.get("params") or []
-                if len(params) >= 1:
-                    if len(params) >= 9:
-                        params[-1] = True
-                    else:
-                        while len(params) < 9:
-                            params.append(None)
-                        params[-1] = True
-                    nm["params"] = params
-                nm2 = sanitize_downstream_notification(nm)
-                log("downstream_send_notify", payload=nm2)
-                # Ensure diff context is re-asserted before resend clean notify (prevents low-diff bursts)
-                await self.maybe_send_downstream_extranonce(pool_key)
-                sent_diff = await self.maybe_send_downstream_diff(pool_key, force=True)
-                if sent_diff:
-                    await asyncio.sleep(0.25)
-                await write_line(self.miner_w, dumps_json(nm2), "downstream")
+            line = self.latest_notify_clean.get(pool_key)
+            if line is not None:
+                if log_enabled("downstream_send_notify"):
+                    log("downstream_send_notify", payload=line.decode("utf-8", errors="replace").strip())
+                # Ensure diff context is re-asserted before resend clean notify (prevents low-diff bursts).
+                if await self.forward_notify(pool_key, raw, force_diff=True) is None:
+                    return
                 # Commit forwarded-job state for submit routing (resend path must mirror scheduler forward path)
                 self.last_forwarded_pool = pool_key
                 self.last_forwarded_jobid = jid
                 if jid:
-                    self.job_owner[(pool_key, jid)] = pool_key
+                    self.record_job_owner(pool_key, jid)
                 self.last_notify_mono[pool_key] = time.monotonic()
                 log("resend_notify_clean", sid=self.sid, pool=pool_key, jobid=jid, reason=reason)
                 return
         except Exception as e:
             log("resend_notify_error", sid=self.sid, pool=pool_key, jobid=jid, reason=reason, err=str(e))
-        log("downstream_send_raw", payload=raw.decode("utf-8", errors="replace"))
+        if log_enabled("downstream_send_raw"):
+            log("downstream_send_raw", payload=raw.decode("utf-8", errors="replace"))
         await write_line(self.miner_w, raw, "downstream")
         log("resend_notify_raw", sid=self.sid, pool=pool_key, jobid=jid, reason=reason)
 
+    # Route one mining.submit to the pool that owns its job
+    async def handle_submit(self, raw: bytes, msg: Dict[str, Any], now: float) -> None:
+        # Guard: drop submits until we've forwarded at least one job in this session.
+        # Prevents stale submits right after reconnect causing 'job not found'.
+        if self.last_forwarded_jobid is None:
+            log("submit_dropped_no_job_yet", sid=self.sid, mid=msg.get("id"), jid=jobid_from_submit(msg), last_pool=self.last_forwarded_pool)
+            await write_line(self.miner_w, dumps_json({"id": msg.get("id"), "result": False, "error": {"code": 21, "message": "job not found", "data": None}}), "downstream")
+            return
+
+        SHARES_SUBMITTED.inc()
+        jid = jobid_from_submit(msg)
+        pool = "A"
+        reason = "default_A"
+        # Pool keys are always the "A"/"B" literals (never parsed from
+        # pool/miner JSON), so check the last forwarded pool once here.
+        last_pool_known = self.last_forwarded_pool in ("A", "B")
+        if jid is None:
+            # Some miners/pools may omit/obscure jobid in submit; fall back to last forwarded pool.
+            if last_pool_known:
+                pool = self.last_forwarded_pool
+                reason = "no_jid_fallback"
+        else:
+            # Prefer stable job->pool mapping first (critical during pool switching).
+            pool_map = "A" if jid in self.job_owner_A else ("B" if jid in self.job_owner_B else None)
+            if pool_map is not None:
+                pool = pool_map
+                reason = "job_owner_map"
+            elif self.last_forwarded_jobid == jid and last_pool_known:
+                pool = self.last_forwarded_pool
+                reason = "last_forwarded_match"
+            elif last_pool_known:
+                # If miner submits a jid we never forwarded/mapped, do NOT forward upstream.
+                # Avoid upstream "job not found" churn (seen on Nano3S right after connect).
+                if self.last_forwarded_jobid is not None and jid != self.last_forwarded_jobid:
+                    log("submit_dropped_unknown_jid", sid=self.sid, mid=msg.get("id"), jid=jid,
+                        last_jobid=self.last_forwarded_jobid, last_pool=self.last_forwarded_pool)
+                    await write_line(self.miner_w, dumps_json({"id": msg.get("id"), "result": False,
+                        "error": {"code": 21, "message": "job not found", "data": None}}), "downstream")
+                    return
+                pool = self.last_forwarded_pool
+                reason = "last_forwarded_pool_fallback"
+        # Per-share events: commonly denied, so skip building their fields when filtered.
+        if log_enabled("submit_route"):
+            log("submit_route", sid=self.sid, jid=jid, pool=pool, reason=reason,
+                last_jobid=self.last_forwarded_jobid, last_pool=self.last_forwarded_pool)
+        # Dedupe: miners sometimes retry identical submits (timeout / reconnect).
+        # Forwarding duplicates upstream produces "Duplicate share" rejects.
+        try:
+            pms = msg.get("params") or []
+            # Params: [user, jobid, extranonce2, ntime, nonce, (optional) versionbits]
+            # One flat string key (exact, so no false "duplicate" drops) instead of
+            # a 5-tuple: a single hash + compare per lookup.
+            fp = "|".join([str(x) for x in pms[1:6]])
+            mfp = self.submit_fp_last.get(pool)
+            if mfp is None:
+                mfp = OrderedDict()
+                self.submit_fp_last[pool] = mfp
+            ttl = float(getattr(self, "submit_fp_ttl_s", 45.0) or 45.0)
+            # Entries are inserted in time order and never re-stamped, so
+            # expired ones are always at the front: pop until a fresh one.
+            while mfp:
+                k0 = next(iter(mfp))
+                if (now - mfp[k0]) <= ttl:
+                    break
+                mfp.popitem(last=False)
+            mx = int(getattr(self, "submit_fp_max", 512) or 512)
+            while len(mfp) > mx:
+                mfp.popitem(last=False)
+            last = mfp.get(fp)
+            if last is not None and (now - float(last)) <= ttl:
+                log("submit_dropped_duplicate_fp", sid=self.sid, mid=msg.get("id"), jid=jid, pool=pool)
+                await write_line(self.miner_w, dumps_json({"id": msg.get("id"), "result": False,
+                    "error": {"code": 22, "message": "duplicate share", "data": None}}), "downstream")
+                return
+            mfp[fp] = now
+        except Exception as e:
+            log("submit_dedupe_error", sid=self.sid, err=str(e))
+
+
+        # Guard: reject submits if miner extranonce context doesn't match target pool.
+        # If we recently sent mining.set_extranonce for the other pool, the miner may be
+        # building shares against the wrong extranonce1, which will produce mass rejects.
+        ex_pool = getattr(self, "last_downstream_extranonce_pool", None)
+        if ex_pool in ("A", "B") and ex_pool != pool:
+            age = None
+            if self.last_switch_mono is not None:
+                age = now - float(self.last_switch_mono)
+
+            if age is not None and age < SWITCH_SUBMIT_GRACE_S:
+                # Grace window: allow in-flight submits for the previous pool job to be forwarded.
+                # We route by job ownership (target_pool=pool). Rejecting here creates unnecessary drops.
+                log("submit_extranonce_mismatch_grace_forward", sid=self.sid, mid=msg.get("id"), jid=jid,
+                    target_pool=pool, last_extranonce_pool=ex_pool, age_s=round(age, 3))
+            else:
+                log("submit_dropped_extranonce_mismatch", sid=self.sid, mid=msg.get("id"), jid=jid,
+                    target_pool=pool, last_extranonce_pool=ex_pool,
+                    last_jobid=self.last_forwarded_jobid, last_pool=self.last_forwarded_pool)
+                await write_line(self.miner_w, dumps_json({"id": msg.get("id"), "result": False,
+                    "error": {"code": 23, "message": "stale extranonce context", "data": None}}), "downstream")
+                return
+
+        mid = msg.get("id")
+        # Both per-pool difficulties are read once here and reused by the
+        # snapshot logs, the pending entry and the low-diff check below.
+        d = self.last_downstream_diff_by_pool.get(pool)
+        pool_d = self.latest_diff.get(pool)
+        if mid is not None:
+            # Submit-time snapshot for debugging diff mismatches (VarDiff / miner apply lag).
+            # Debug-level: only unpack params when the event is actually emitted.
+            if log_enabled("submit_snapshot"):
+                pms = msg.get("params") or []
+                u0 = pms[0] if len(pms) > 0 else None
+                en2 = pms[2] if len(pms) > 2 else None
+                ntime = pms[3] if len(pms) > 3 else None
+                nonce = pms[4] if len(pms) > 4 else None
+                # versionbits is optional (only for version-rolling miners)
+                vb = pms[5] if len(pms) > 5 else None
+
+                log("submit_snapshot", sid=self.sid, jid=jid, pool=pool, mid=mid,
+                    user=u0, extranonce2=en2, ntime=ntime, nonce=nonce, versionbits=vb,
+                    active=(self.last_forwarded_pool or self.handshake_pool),
+                    raw_subscribe_forwarded_pool=getattr(self, "raw_subscribe_forwarded_pool", None),
+                    last_downstream_diff_snapshot=d, pool_latest_diff=pool_d,
+                    last_jobid=self.last_forwarded_jobid, last_pool=self.last_forwarded_pool)
+
+            # Local quick sanity: estimate share difficulty from submit nonce.
+            # Debug-level too; skip the float/int/f-string work when filtered.
+            if log_enabled("submit_local_sanity"):
+                try:
+                    # Params: [user, jobid, extranonce2, ntime, nonce, (optional) versionbits]
+                    p = msg.get("params") or []
+                    nonce_hex = p[4] if len(p) > 4 else None
+                    if nonce_hex is not None:
+                        # Very rough heuristic: random hash expected diff ~ 1
+                        # If miner were meeting diff~3000, accept rate would be ~1/3000.
+                        # Log just to correlate submit frequency vs expected accepts.
+                        log("submit_local_sanity",
+                            sid=self.sid, mid=mid, jid=jid, pool=pool,
+                            expected_accept_rate=f"~1/{int(float(d or pool_d or 1))}")
+
+                except Exception as e:
+                    log("submit_local_sanity_error", sid=self.sid, err=str(e))
+
+        self.submit_pending[mid] = (pool, float((d if d is not None else pool_d) or 0.0))
+        # Orphaned entries (pool never answered) are evicted oldest first.
+        if len(self.submit_pending) > _SUBMIT_OWNER_MAX:
+            self.submit_pending.pop(next(iter(self.submit_pending)), None)
+
+        # Failover guard: reject submit if target pool is dead 
+        # If the pool that owns this job just died, we can't forward
+        # the share.  Send the miner a clean rejection instead of
+        # crashing on a None writer.
+        if not self.pool_alive.get(pool, False):
+            log("submit_dropped_pool_dead", sid=self.sid, mid=msg.get("id"),
+                jid=jid, pool=pool)
+            self.submit_pending.pop(mid, None)
+            await write_line(self.miner_w, dumps_json({
+                "id": msg.get("id"), "result": False,
+                "error": {"code": 21, "message": "pool unavailable", "data": None}
+            }), "downstream")
+            return
+
+        # Low-diff suppression: after a pool switch, the miner may
+        # have a pipeline of shares built at the old (lower) pool's
+        # difficulty.  These will be rejected by the new pool as
+        # "low difficulty share".  Instead of forwarding them upstream
+        # (where they waste bandwidth and inflate reject counters),
+        # we silently absorb them and send a fake "accepted" back to
+        # the miner.  This only applies during a brief grace window
+        # after a switch, so normal VarDiff adjustments are unaffected.
+        #
+        # We compare the share's expected difficulty (what we last
+        # sent downstream for this pool) against the pool's current
+        # required difficulty.  If our downstream diff is less than
+        # 50% of the pool's diff, the share will almost certainly be
+        # rejected as low-diff.
+        _switch_age = None
+        if self.last_switch_mono is not None:
+            _switch_age = now - self.last_switch_mono
+        if _switch_age is not None and _switch_age < SWITCH_SUBMIT_GRACE_S:
+            _pool_diff = pool_d or 0.0
+            _our_diff = d or 0.0
+            # Only suppress if we know both diffs and ours is way below pool's
+            if _pool_diff > 0 and _our_diff > 0 and _our_diff < _pool_diff * 0.5:
+                _suppressed = getattr(self, "_lowdiff_suppressed", 0)
+                self._lowdiff_suppressed = _suppressed + 1
+                # Log once per burst (first suppression and then every 50th)
+                if _suppressed == 0 or _suppressed % 50 == 0:
+                    log("submit_suppressed_low_diff", sid=self.sid,
+                        mid=msg.get("id"), jid=jid, pool=pool,
+                        our_diff=_our_diff, pool_diff=_pool_diff,
+                        switch_age_s=round(_switch_age, 2),
+                        suppressed_count=_suppressed + 1)
+                # Send fake "accepted" so the miner does not slow down or error
+                self.submit_pending.pop(mid, None)
+                await write_line(self.miner_w, dumps_json({
+                    "id": msg.get("id"), "result": True, "error": None
+                }), "downstream")
+                return
+        else:
+            # Outside grace window: reset suppression counter
+            if getattr(self, "_lowdiff_suppressed", 0) > 0:
+                log("submit_suppressed_low_diff_end", sid=self.sid,
+                    pool=pool, total_suppressed=self._lowdiff_suppressed)
+                self._lowdiff_suppressed = 0
+
+        if pool == "B":
+            pk, user, w, side = "B", self.submit_user_B, self.wB, "upstreamB"
+        else:
+            pk, user, w, side = "A", self.submit_user_A, self.wA, "upstreamA"
+
+        # submit user should match pool wallet + miner worker
+        # (versionbits, if present, are left untouched).
+        # If the miner already submits as that user, its own line is forwarded
+        # as-is; otherwise the user is rewritten in place (msg is consumed
+        # right here, so there is no need to copy the dict or params list).
+        # Malformed (non-list) params are forwarded untouched for the pool to reject.
+        pms = msg.get("params")
+        if isinstance(pms, list) and pms and not (isinstance(pms[0], str) and (user is None or pms[0] == user)):
+            pms[0] = user if user is not None else str(pms[0])
+            data = dumps_json(msg)
+        else:
+            data = raw if raw.endswith(b"\n") else raw + b"\n"
+        # --- Stats tab: record submit time for latency measurement ---
+        _pool_record_submit_time(msg.get("id"), pk)
+        await write_line(w, data, side)
+
     # Forward miner messages to upstream pools
     async def miner_to_pools(self):
         # At 100/0 or 0/100, only one pool writer exists. That's OK.
         assert self.wA or self.wB, "No upstream pool connections available"
 
         async for raw in iter_lines(self.miner_r, "downstream"):
+            # One clock read per inbound message; reused by the submit path
+            # (dedupe TTL, switch-grace ages) up to its upstream send.
+            now = time.monotonic()
             try:
                 msg = loads_json(raw)
             except Exception as e:
@@ -1587,6 +2241,11 @@ class ProxySession:
             m = msg.get("method")
             if m:
                 log("miner_method", sid=self.sid, method=m)
+            # Submits are by far the most frequent miner message: check them first.
+            if m == "mining.submit":
+                await self.handle_submit(raw, msg, now)
+                continue
+
             if m == "mining.configure":
                 # Forward mining.configure to the handshake pool so its response goes back to the miner,
                 # BUT also send a copy to the other pool using an internal id so we can consume the reply
@@ -1634,7 +2293,6 @@ class ProxySession:
                     other_w = getattr(self.cfg.sched, "wB" if other == "B" else "wA", 0)
                     if other_w > 0:
                         iid = self.next_internal_id()
-                        self._internal_ids.add(iid)
                         msg2 = dict(msg)
                         msg2["id"] = iid
                         await self.send_upstream(other, msg2)
@@ -1756,228 +2414,6 @@ class ProxySession:
 
                 continue
 
-            if m == "mining.submit":
-                # Guard: drop submits until we've forwarded at least one job in this session.
-                # Prevents stale submits right after reconnect causing 'job not found'.
-                if self.last_forwarded_jobid is None:
-                    log("submit_dropped_no_job_yet", sid=self.sid, mid=msg.get("id"), jid=jobid_from_submit(msg), last_pool=self.last_forwarded_pool)
-                    await write_line(self.miner_w, dumps_json({"id": msg.get("id"), "result": False, "error": {"code": 21, "message": "job not found", "data": None}}), "downstream")
-                    continue
-
-                SHARES_SUBMITTED.inc()
-                jid = jobid_from_submit(msg)
-                pool = "A"
-                reason = "default_A"
-                if jid is None:
-                    # Some miners/pools may omit/obscure jobid in submit; fall back to last forwarded pool.
-                    if self.last_forwarded_pool in ("A","B"):
-                        pool = self.last_forwarded_pool
-                        reason = "no_jid_fallback"
-                else:
-                    # Prefer stable job->pool mapping first (critical during pool switching).
-                    pool_map = self.job_owner.get(("A", jid)) or self.job_owner.get(("B", jid))
-                    if pool_map in ("A","B"):
-                        pool = pool_map
-                        reason = "job_owner_map"
-                    elif self.last_forwarded_jobid == jid and self.last_forwarded_pool in ("A","B"):
-                        pool = self.last_forwarded_pool
-                        reason = "last_forwarded_match"
-                    elif self.last_forwarded_pool in ("A","B"):
-                        # If miner submits a jid we never forwarded/mapped, do NOT forward upstream.
-                        # Avoid upstream "job not found" churn (seen on Nano3S right after connect).
-                        if self.last_forwarded_jobid is not None and jid != self.last_forwarded_jobid:
-                            log("submit_dropped_unknown_jid", sid=self.sid, mid=msg.get("id"), jid=jid,
-                                last_jobid=self.last_forwarded_jobid, last_pool=self.last_forwarded_pool)
-                            await write_line(self.miner_w, dumps_json({"id": msg.get("id"), "result": False,
-                                "error": {"code": 21, "message": "job not found", "data": None}}), "downstream")
-                            continue
-                        pool = self.last_forwarded_pool
-                        reason = "last_forwarded_pool_fallback"
-                log("submit_route", sid=self.sid, jid=jid, pool=pool, reason=reason,
-                    last_jobid=self.last_forwarded_jobid, last_pool=self.last_forwarded_pool)
-                # Dedupe: miners sometimes retry identical submits (timeout / reconnect).
-                # Forwarding duplicates upstream produces "Duplicate share" rejects.
-                try:
-                    pms = msg.get("params") or []
-                    # Params: [user, jobid, extranonce2, ntime, nonce, (optional) versionbits]
-                    fp = (
-                        str(pms[1]) if len(pms) > 1 else None,
-                        str(pms[2]) if len(pms) > 2 else None,
-                        str(pms[3]) if len(pms) > 3 else None,
-                        str(pms[4]) if len(pms) > 4 else None,
-                        str(pms[5]) if len(pms) > 5 else None,
-                    )
-                    now = time.monotonic()
-                    mfp = self.submit_fp_last.get(pool)
-                    if mfp is None:
-                        mfp = {}
-                        self.submit_fp_last[pool] = mfp
-                    ttl = float(getattr(self, "submit_fp_ttl_s", 45.0) or 45.0)
-                    if mfp:
-                        old = [k for k,v in mfp.items() if (now - float(v)) > ttl]
-                        for k in old:
-                            mfp.pop(k, None)
-                    mx = int(getattr(self, "submit_fp_max", 512) or 512)
-                    if len(mfp) > mx:
-                        for k,_v in sorted(mfp.items(), key=lambda kv: kv[1])[: max(1, len(mfp) - mx)]:
-                            mfp.pop(k, None)
-                    last = mfp.get(fp)
-                    if last is not None and (now - float(last)) <= ttl:
-                        log("submit_dropped_duplicate_fp", sid=self.sid, mid=msg.get("id"), jid=jid, pool=pool)
-                        await write_line(self.miner_w, dumps_json({"id": msg.get("id"), "result": False,
-                            "error": {"code": 22, "message": "duplicate share", "data": None}}), "downstream")
-                        continue
-                    mfp[fp] = now
-                except Exception as e:
-                    log("submit_dedupe_error", sid=self.sid, err=str(e))
-
-
-                # Guard: reject submits if miner extranonce context doesn't match target pool.
-                # If we recently sent mining.set_extranonce for the other pool, the miner may be
-                # building shares against the wrong extranonce1, which will produce mass rejects.
-                ex_pool = getattr(self, "last_downstream_extranonce_pool", None)
-                if ex_pool in ("A", "B") and ex_pool != pool:
-                    age = None
-                    if self.last_switch_mono is not None:
-                        age = time.monotonic() - float(self.last_switch_mono)
-
-                    if age is not None and age < SWITCH_SUBMIT_GRACE_S:
-                        # Grace window: allow in-flight submits for the previous pool job to be forwarded.
-                        # We route by job ownership (target_pool=pool). Rejecting here creates unnecessary drops.
-                        log("submit_extranonce_mismatch_grace_forward", sid=self.sid, mid=msg.get("id"), jid=jid,
-                            target_pool=pool, last_extranonce_pool=ex_pool, age_s=round(age, 3))
-                    else:
-                        log("submit_dropped_extranonce_mismatch", sid=self.sid, mid=msg.get("id"), jid=jid,
-                            target_pool=pool, last_extranonce_pool=ex_pool,
-                            last_jobid=self.last_forwarded_jobid, last_pool=self.last_forwarded_pool)
-                        await write_line(self.miner_w, dumps_json({"id": msg.get("id"), "result": False,
-                            "error": {"code": 23, "message": "stale extranonce context", "data": None}}), "downstream")
-                        continue
-
-                self.submit_owner[msg.get("id")] = pool
-                mid = msg.get("id")
-                if mid is not None:
-                    d = self.last_downstream_diff_by_pool.get(pool)
-                    # Submit-time snapshot for debugging diff mismatches (VarDiff / miner apply lag).
-                    pms = msg.get("params") or []
-                    u0 = pms[0] if len(pms) > 0 else None
-                    en2 = pms[2] if len(pms) > 2 else None
-                    ntime = pms[3] if len(pms) > 3 else None
-                    nonce = pms[4] if len(pms) > 4 else None
-                    # versionbits is optional (only for version-rolling miners)
-                    vb = pms[5] if len(pms) > 5 else None
-
-                    log("submit_snapshot", sid=self.sid, jid=jid, pool=pool, mid=mid,
-                        user=u0, extranonce2=en2, ntime=ntime, nonce=nonce, versionbits=vb,
-                        active=(self.last_forwarded_pool or self.handshake_pool),
-                        raw_subscribe_forwarded_pool=getattr(self, "raw_subscribe_forwarded_pool", None),
-                        last_downstream_diff_snapshot=d, pool_latest_diff=self.latest_diff.get(pool),
-                        last_jobid=self.last_forwarded_jobid, last_pool=self.last_forwarded_pool)
-
-                    # Local quick sanity: estimate share difficulty from submit nonce.
-                    try:
-                        # Params: [user, jobid, extranonce2, ntime, nonce, (optional) versionbits]
-                        p = msg.get("params") or []
-                        nonce_hex = p[4] if len(p) > 4 else None
-                        if nonce_hex is not None:
-                            # Very rough heuristic: random hash expected diff ~ 1
-                            # If miner were meeting diff~3000, accept rate would be ~1/3000.
-                            # Log just to correlate submit frequency vs expected accepts.
-                            log("submit_local_sanity",
-                                sid=self.sid, mid=mid, jid=jid, pool=pool,
-                                expected_accept_rate=f"~1/{int(float(d or self.latest_diff.get(pool) or 1))}")
-
-                    except Exception as e:
-                        log("submit_local_sanity_error", sid=self.sid, err=str(e))
-
-                    if d is None:
-                        d = self.latest_diff.get(pool)
-                    self.submit_diff[mid] = float(d or 0.0)
-
-                # Failover guard: reject submit if target pool is dead 
-                # If the pool that owns this job just died, we can't forward
-                # the share.  Send the miner a clean rejection instead of
-                # crashing on a None writer.
-                if not self.pool_alive.get(pool, False):
-                    log("submit_dropped_pool_dead", sid=self.sid, mid=msg.get("id"),
-                        jid=jid, pool=pool)
-                    self.submit_owner.pop(msg.get("id"), None)
-                    self.submit_diff.pop(msg.get("id"), None)
-                    await write_line(self.miner_w, dumps_json({
-                        "id": msg.get("id"), "result": False,
-                        "error": {"code": 21, "message": "pool unavailable", "data": None}
-                    }), "downstream")
-                    continue
-
-                # Low-diff suppression: after a pool switch, the miner may
-                # have a pipeline of shares built at the old (lower) pool's
-                # difficulty.  These will be rejected by the new pool as
-                # "low difficulty share".  Instead of forwarding them upstream
-                # (where they waste bandwidth and inflate reject counters),
-                # we silently absorb them and send a fake "accepted" back to
-                # the miner.  This only applies during a brief grace window
-                # after a switch, so normal VarDiff adjustments are unaffected.
-                #
-                # We compare the share's expected difficulty (what we last
-                # sent downstream for this pool) against the pool's current
-                # required difficulty.  If our downstream diff is less than
-                # 50% of the pool's diff, the share will almost certainly be
-                # rejected as low-diff.
-                _switch_age = None
-                if self.last_switch_mono is not None:
-                    _switch_age = time.monotonic() - self.last_switch_mono
-                if _switch_age is not None and _switch_age < SWITCH_SUBMIT_GRACE_S:
-                    _pool_diff = self.latest_diff.get(pool) or 0.0
-                    _our_diff = self.last_downstream_diff_by_pool.get(pool) or 0.0
-                    # Only suppress if we know both diffs and ours is way below pool's
-                    if _pool_diff > 0 and _our_diff > 0 and _our_diff < _pool_diff * 0.5:
-                        _suppressed = getattr(self, "_lowdiff_suppressed", 0)
-                        self._lowdiff_suppressed = _suppressed + 1
-                        # Log once per burst (first suppression and then every 50th)
-                        if _suppressed == 0 or _suppressed % 50 == 0:
-                            log("submit_suppressed_low_diff", sid=self.sid,
-                                mid=msg.get("id"), jid=jid, pool=pool,
-                                our_diff=_our_diff, pool_diff=_pool_diff,
-                                switch_age_s=round(_switch_age, 2),
-                                suppressed_count=_suppressed + 1)
-                        # Send fake "accepted" so the miner does not slow down or error
-                        self.submit_owner.pop(msg.get("id"), None)
-                        self.submit_diff.pop(msg.get("id"), None)
-                        await write_line(self.miner_w, dumps_json({
-                            "id": msg.get("id"), "result": True, "error": None
-                        }), "downstream")
-                        continue
-                else:
-                    # Outside grace window: reset suppression counter
-                    if getattr(self, "_lowdiff_suppressed", 0) > 0:
-                        log("submit_suppressed_low_diff_end", sid=self.sid,
-                            pool=pool, total_suppressed=self._lowdiff_suppressed)
-                        self._lowdiff_suppressed = 0
-
-                if pool == "B":
-                    out = dict(msg)
-                    params = list(out.get("params") or [])
-                    if params:
-                        # submit user should match pool wallet + miner worker
-                        params[0] = f"{self.cfg.poolB.wallet}.{self.worker}" if self.cfg.poolB.wallet else str(params[0])
-                        # Keep versionbits if present (miners may be version-rolling).
-                        out["params"] = params
-                    # --- Stats tab: record submit time for latency measurement ---
-                    _pool_record_submit_time(msg.get("id"), "B")
-                    await write_line(self.wB, dumps_json(out), "upstreamB")
-                else:
-                    out = dict(msg)
-                    params = list(out.get("params") or [])
-                    if params:
-                        # submit user should match pool wallet + miner worker
-                        params[0] = f"{self.cfg.poolA.wallet}.{self.worker}" if self.cfg.poolA.wallet else str(params[0])
-                        # Keep versionbits if present (miners may be version-rolling).
-                        out["params"] = params
-                    # --- Stats tab: record submit time for latency measurement ---
-                    _pool_record_submit_time(msg.get("id"), "A")
-                    await write_line(self.wA, dumps_json(out), "upstreamA")
-                continue
-
             if self.wA is not None:
                 await write_line(self.wA, raw, "upstreamA")
             if self.wB is not None:
@@ -2003,7 +2439,9 @@ class ProxySession:
                     log("upstream_response_dup_observed", sid=self.sid, pool=pool_key, id=mid)
                     continue
 
-                self.seen_upstream_response_ids.add((pool_key, mid))
+                self.seen_upstream_response_ids[(pool_key, mid)] = None
+                if len(self.seen_upstream_response_ids) > _SEEN_RESPONSE_IDS_MAX:
+                    self.seen_upstream_response_ids.popitem(last=False)
 
             if method == "mining.set_difficulty":
                 # Track upstream diff, but DO NOT forward directly to miner.
@@ -2022,7 +2460,12 @@ class ProxySession:
                 self.latest_notify_raw[pool_key] = raw
                 jid = jobid_from_notify(msg)
                 self.latest_jobid[pool_key] = jid
+                try:
+                    self.latest_notify_clean[pool_key] = clean_notify_line(msg)
+                except Exception:
+                    self.latest_notify_clean[pool_key] = None
                 self.notify_seq[pool_key] += 1
+                self.notify_event.set()
                 log("pool_notify", sid=self.sid, pool=pool_key, jobid=jid, seq=self.notify_seq[pool_key])
                 continue
 
@@ -2030,8 +2473,11 @@ class ProxySession:
                 mid = msg.get("id")
 
                 # INTERNAL bootstrap traffic: process but DO NOT forward to miner.
-                if isinstance(mid, int) and mid in getattr(self, "_internal_ids", set()):
-                    if getattr(self, "_internal_subscribe_id", {}).get(pool_key) == mid:
+                if self.is_internal_id(mid):
+                    # Both maps always exist (set in __init__); one lookup each per response.
+                    sub_id = self._internal_subscribe_id.get(pool_key)
+                    auth_id = self._internal_authorize_id.get(pool_key)
+                    if mid == sub_id:
                         try:
                             res = msg.get("result")
                             # Typical subscribe result: [ [..], extranonce1, extranonce2_size ]
@@ -2046,7 +2492,7 @@ class ProxySession:
                                     extranonce1=self.extranonce1[pool_key], extranonce2_size=self.extranonce2_size[pool_key])
                         except Exception as e:
                             log("pool_bootstrap_subscribe_parse_error", sid=self.sid, pool=pool_key, err=str(e))
-                    if getattr(self, "_internal_authorize_id", {}).get(pool_key) == mid:
+                    elif mid == auth_id:
                         log("pool_bootstrap_auth_result", sid=self.sid, pool=pool_key,
                             ok=bool(msg.get("result")), error=msg.get("error"))
                     continue
@@ -2114,6 +2560,11 @@ class ProxySession:
                     already_switched_away = (last_en_pool is not None and last_en_pool != pool_key)
                     if ok_auth and (self.handshake_pool is not None) and (pool_key == self.handshake_pool) and (not already_switched_away):
                         try:
+                            # The three setup lines are collected and written as one batch
+                            # (single writelines + drain); TCP preserves their order.
+                            bufs: list[bytes] = []
+                            notify_jid: Any = None
+                            notify_queued = False
                             # Extranonce (if known)
                             # Skip if we already raw-forwarded the subscribe response for this pool 
                             # the miner already has the extranonce.  Sending mining.set_extranonce
@@ -2128,7 +2579,7 @@ class ProxySession:
                                 else:
                                     en_msg = {"method": "mining.set_extranonce", "params": [str(en1), int(en2s)]}
                                     log("post_auth_push_extranonce", sid=self.sid, pool=pool_key, extranonce1=str(en1), extranonce2_size=int(en2s))
-                                    await write_line(self.miner_w, dumps_json(en_msg), "downstream")
+                                    bufs.append(dumps_json(en_msg))
                             # Difficulty (prefer latest pool diff if we have it)
                             diff = None
                             try:
@@ -2136,62 +2587,54 @@ class ProxySession:
                             except Exception:
                                 diff = None
                             if diff is not None and diff > 0:
-                                dmsg = {"method": "mining.set_difficulty", "params": [int(diff)]}
                                 log("post_auth_push_diff", sid=self.sid, pool=pool_key, diff=diff, diff_sent=int(diff))
-                                await write_line(self.miner_w, dumps_json(dmsg), "downstream")
+                                bufs.append(SET_DIFFICULTY_TMPL % int(diff))
 
                             # Notify (force clean_jobs=true)
-                            raw_n = self.latest_notify_raw.get(pool_key)
-                            if raw_n:
-                                try:
-                                    n = loads_json(raw_n)
-                                    if isinstance(n, dict) and n.get("method") == "mining.notify" and isinstance(n.get("params"), list) and len(n["params"]) >= 1:
-                                        n["params"][-1] = True
-                                        log("post_auth_push_notify_clean", sid=self.sid, pool=pool_key)
-                                        await write_line(self.miner_w, dumps_json(n), "downstream")
-                                        # Commit forwarded-job state for submit routing (post-auth path must mirror resend/scheduler path)
-                                        jid = None
-                                        try:
-                                            if isinstance(n, dict):
-                                                ps = n.get("params")
-                                                if isinstance(ps, list) and len(ps) >= 1:
-                                                    jid = ps[0]
-                                        except Exception:
-                                            jid = None
-                                        self.last_forwarded_pool = pool_key
-                                        self.last_forwarded_jobid = jid
-                                        if jid:
-                                            self.job_owner[(pool_key, jid)] = pool_key
-                                        self.last_notify_mono[pool_key] = time.monotonic()
-                                except Exception as e:
-                                    log("post_auth_push_notify_clean_error", sid=self.sid, pool=pool_key, err=str(e))
+                            # write_lines() does not sanitize; the cached clean line already is.
+                            line = self.latest_notify_clean.get(pool_key)
+                            if line is not None:
+                                log("post_auth_push_notify_clean", sid=self.sid, pool=pool_key)
+                                bufs.append(line)
+                                notify_jid = self.latest_jobid.get(pool_key)
+                                notify_queued = True
+
+                            if bufs:
+                                await write_lines(self.miner_w, bufs, "downstream")
+                            if notify_queued:
+                                # Commit forwarded-job state for submit routing (post-auth path must mirror resend/scheduler path)
+                                self.last_forwarded_pool = pool_key
+                                self.last_forwarded_jobid = notify_jid
+                                if notify_jid:
+                                    self.record_job_owner(pool_key, notify_jid)
+                                self.last_notify_mono[pool_key] = time.monotonic()
                         except Exception as e:
                             log("post_auth_push_setup_error", sid=self.sid, pool=pool_key, err=str(e))
 
                 # Forward subscribe/auth responses ONLY from the selected handshake pool
-                if mid not in self.submit_owner:
-                    if (mid not in self.submit_owner) and (self.handshake_pool is not None and pool_key != self.handshake_pool):
-                        log("handshake_response_dropped", sid=self.sid, pool=pool_key, id=mid, chosen=self.handshake_pool)
-                        continue
+                if mid not in self.submit_pending and self.handshake_pool is not None and pool_key != self.handshake_pool:
+                    log("handshake_response_dropped", sid=self.sid, pool=pool_key, id=mid, chosen=self.handshake_pool)
+                    continue
 
-                log("id_response_seen", sid=self.sid, pool=pool_key, id=mid, in_submit_owner=(mid in self.submit_owner), handshake_pool=self.handshake_pool)
+                if log_enabled("id_response_seen"):
+                    log("id_response_seen", sid=self.sid, pool=pool_key, id=mid, in_submit_owner=(mid in self.submit_pending), handshake_pool=self.handshake_pool)
                 # If we already raw-forwarded the subscribe response for this pool,
                 # do NOT also forward it again via the generic id-response path.
                 if self.subscribe_id is not None and mid == self.subscribe_id and getattr(self, "raw_subscribe_forwarded_pool", None) == pool_key:
                     log("subscribe_id_response_skipped_duplicate", sid=self.sid, pool=pool_key, id=mid)
                     continue
 
-                if mid in self.submit_owner:
-                    p = self.submit_owner.pop(mid)
-                    d = float(self.submit_diff.pop(mid, 0.0))
+                pending = self.submit_pending.pop(mid, None)
+                if pending is not None:
+                    p, d = pending
                     ok = bool(msg.get("result"))
 
                     # --- Stats tab: pool latency (submit -> result round-trip) ---
                     _pool_record_result_time(mid)
 
                     if ok:
-                        SHARES_ACCEPTED.labels(pool=p).inc()
-                        ACCEPTED_DIFFICULTY_SUM.labels(pool=p).inc(d)
+                        SHARES_ACCEPTED_BY_POOL[p].inc()
+                        ACCEPTED_DIFFICULTY_SUM_BY_POOL[p].inc(d)
                         # Scheduler counters now use TIME-BASED credits (accumulated
                         # in forward_jobs), not per-share difficulty.  This prevents
                         # high-hashrate miners from dominating the ratio calculation.
@@ -2219,7 +2662,7 @@ class ProxySession:
                             pass
 
                     else:
-                        SHARES_REJECTED.labels(pool=p).inc()
+                        SHARES_REJECTED_BY_POOL[p].inc()
                         log("share_result", sid=self.sid, pool=p, accepted=False, error=msg.get("error"))
 
                         # --- Stats tab: per-worker rejected share tracking ---
@@ -2275,6 +2718,7 @@ class ProxySession:
           as "low difficulty".
         """
         self.latest_notify_raw[pool_key] = None
+        self.latest_notify_clean[pool_key] = None
         self.latest_jobid[pool_key] = None
         self.latest_diff[pool_key] = None
 
@@ -2315,71 +2759,43 @@ class ProxySession:
         log("pool_state_cleared", sid=self.sid, pool=pool_key)
 
 
-    # Periodic state pruning 
-    # Several dicts/sets grow with every job or upstream response but
-    # are never trimmed.  Over weeks of runtime this leaks memory.
-    # This method is called every ~60 seconds from forward_jobs().
+    # Periodic state report 
+    # Several dicts/sets grow with every job or upstream response.  They
+    # used to be trimmed here in bulk; they are now capped as they grow.
+    # This method is called every ~60 seconds from state_report_loop().
     def prune_stale_state(self):
-        """Remove entries older than 5 minutes from structures that grow unbounded."""
-        now = time.monotonic()
-        max_age = 300.0  # 5 minutes -- no job/response older than this is useful
-
-        # 1) job_owner: keyed by (pool_key, jobid).
-        #    Keep only the last ~200 entries.  Jobs older than that are
-        #    long expired; no miner will submit against them.
-        max_jobs = 200
-        if len(self.job_owner) > max_jobs:
-            # We can't age these (no timestamp), so just keep the most recent N.
-            # Since Python 3.7+ dicts preserve insertion order, drop from the front.
-            excess = len(self.job_owner) - max_jobs
-            keys_to_drop = list(self.job_owner.keys())[:excess]
-            for k in keys_to_drop:
-                del self.job_owner[k]
-            log("prune_job_owner", sid=self.sid, dropped=excess,
-                remaining=len(self.job_owner))
-
-        # 2) seen_upstream_response_ids: grows with every upstream response.
-        #    These are (pool_key, msg_id) tuples used to de-dupe.
-        #    After a few minutes, no duplicate will arrive.  Cap at 500.
-        max_seen = 500
-        if len(self.seen_upstream_response_ids) > max_seen:
-            # set() has no insertion order, so just clear and start fresh.
-            # The worst that can happen is a duplicate response gets forwarded
-            # once -- harmless, the miner ignores unexpected responses.
-            excess = len(self.seen_upstream_response_ids)
-            self.seen_upstream_response_ids.clear()
-            log("prune_seen_upstream_ids", sid=self.sid, cleared=excess)
-
-        # 3) _internal_ids: bootstrap request IDs.  Grows on each reconnect.
-        #    Only a handful are "active" at any time.  Keep only the last 50.
-        max_internal = 50
-        if len(self._internal_ids) > max_internal:
-            # These are ints; keep the highest (most recent) N.
-            sorted_ids = sorted(self._internal_ids)
-            to_remove = sorted_ids[:len(sorted_ids) - max_internal]
-            for i in to_remove:
-                self._internal_ids.discard(i)
-            log("prune_internal_ids", sid=self.sid, dropped=len(to_remove),
-                remaining=len(self._internal_ids))
-
-        # 4) submit_owner / submit_diff: keyed by message id.
-        #    Normally pop'd when the pool responds, but orphaned entries
-        #    can accumulate if a pool never responds.  Cap at 200.
-        max_submit = 200
-        if len(self.submit_owner) > max_submit:
-            excess = len(self.submit_owner) - max_submit
-            keys_to_drop = list(self.submit_owner.keys())[:excess]
-            for k in keys_to_drop:
-                self.submit_owner.pop(k, None)
-                self.submit_diff.pop(k, None)
-            log("prune_submit_owner", sid=self.sid, dropped=excess,
-                remaining=len(self.submit_owner))
-
-    # End periodic state pruning 
+        """Report the size of per-session caches.
+
+        Every structure that used to be bulk-pruned here is now bounded at
+        insert time, so this never stalls the event loop:
+        - job_owner_A / job_owner_B: record_job_owner(), _JOB_OWNER_MAX per pool
+        - seen_upstream_response_ids: pool_reader(), _SEEN_RESPONSE_IDS_MAX
+        - submit_pending: miner_to_pools(), _SUBMIT_OWNER_MAX
+        - submit_fp_last: TTL + submit_fp_max on every submit
+        - internal ids: a range check, nothing stored
+        """
+        log("session_state_sizes", sid=self.sid,
+            job_owner_A=len(self.job_owner_A), job_owner_B=len(self.job_owner_B),
+            seen_upstream_ids=len(self.seen_upstream_response_ids),
+            submit_pending=len(self.submit_pending),
+            submit_fp_A=len(self.submit_fp_last.get("A") or ()),
+            submit_fp_B=len(self.submit_fp_last.get("B") or ()))
+
+    # Runs as its own session task so the scheduler loop doesn't have to
+    # check a timer on every tick.
+    async def state_report_loop(self):
+        while True:
+            await asyncio.sleep(60.0)
+            try:
+                self.prune_stale_state()
+            except Exception as e:
+                log("session_state_report_error", sid=self.sid, err=str(e))
+
+    # End periodic state report 
 
 
     # Pool Failover: reconnecting wrapper around pool_reader 
-    async def pool_reader_with_reconnect(self, pool_key: str, reader: asyncio.StreamReader):
+    async def pool_reader_with_reconnect(self, pool_key: str, reader: Optional[asyncio.StreamReader]):
         """Wrap pool_reader in a reconnect loop.
 
         Normal flow:
@@ -2391,21 +2807,29 @@ class ProxySession:
           6. If reconnect succeeds -- reset fail counter, loop back to step 1.
           7. If reconnect fails -- increment fail counter, loop back to step 4.
 
+        reader=None (initial connect failed) skips step 1 and starts at step 3.
+
         This method runs forever (until the miner session itself ends),
-        so the asyncio.wait(FIRST_COMPLETED) in run() is no longer
-        triggered by a pool going down.
+        so a pool going down never ends the session: run() only tears the
+        session down when a task returns (raising _SessionTaskDone into its
+        TaskGroup) or fails, and the TaskGroup then cancels this loop with
+        the other tasks. On Python < 3.11 run() uses asyncio.wait(FIRST_COMPLETED)
+        and cancels the rest itself.
         """
         pcfg = self.cfg.poolA if pool_key == "A" else self.cfg.poolB
+        other = "B" if pool_key == "A" else "A"
 
         while True:
             # Phase 1: read from pool until it disconnects 
-            try:
-                await self.pool_reader(pool_key, reader)
-            except asyncio.CancelledError:
-                # Session is shutting down -- don't reconnect, just exit.
-                raise
-            except Exception as e:
-                log("pool_reader_error", sid=self.sid, pool=pool_key, err=str(e))
+            # (no reader when the initial connect failed: go straight to reconnect)
+            if reader is not None:
+                try:
+                    await self.pool_reader(pool_key, reader)
+                except asyncio.CancelledError:
+                    # Session is shutting down -- don't reconnect, just exit.
+                    raise
+                except Exception as e:
+                    log("pool_reader_error", sid=self.sid, pool=pool_key, err=str(e))
 
             # If we get here, pool_reader returned (EOF) or raised.
             # That means the pool's TCP connection is dead.
@@ -2414,16 +2838,19 @@ class ProxySession:
             self.pool_alive[pool_key] = False
             self.pool_last_fail_mono[pool_key] = time.monotonic()
             self.clear_pool_state(pool_key)
+            self.notify_event.set()
             log("pool_down", sid=self.sid, pool=pool_key,
                 fail_count=self.pool_fail_count[pool_key],
-                other_alive=self.pool_alive["B" if pool_key == "A" else "A"])
+                other_alive=self.pool_alive[other])
 
             # Phase 3: reconnect loop with backoff 
             while True:
-                # Exponential backoff: 5, 10, 20, 40, 60, 60, 60 
-                base_delay = 5.0
-                max_delay = 60.0
-                delay = min(base_delay * (2 ** self.pool_fail_count[pool_key]), max_delay)
+                # Exponential backoff: 5, 10, 20, 40, 60, 60, 60 (POOL_RECONNECT_BACKOFF_S)
+                # with "equal jitter": sleep a random 50-100% of that step, so
+                # sessions that lost the pool together don't reconnect in lock-step.
+                # Table lookup: no 2**n growth however long the outage lasts.
+                _step = min(self.pool_fail_count[pool_key], len(POOL_RECONNECT_BACKOFF_S) - 1)
+                delay = POOL_RECONNECT_BACKOFF_S[_step] * (0.5 + random.random() * 0.5)
                 log("pool_reconnect_wait", sid=self.sid, pool=pool_key,
                     delay_s=round(delay, 1),
                     fail_count=self.pool_fail_count[pool_key])
@@ -2453,6 +2880,7 @@ class ProxySession:
                 self.pool_alive[pool_key] = True
                 self.pool_fail_count[pool_key] = 0
                 self.pool_last_fail_mono[pool_key] = None
+                self.notify_event.set()
 
                 # Update reader/writer instance attributes.
                 if pool_key == "A":
@@ -2464,7 +2892,7 @@ class ProxySession:
 
                 reader = r  # use the new reader for the next pool_reader() call
                 log("pool_reconnected", sid=self.sid, pool=pool_key,
-                    other_alive=self.pool_alive["B" if pool_key == "A" else "A"])
+                    other_alive=self.pool_alive[other])
 
                 # Force miner to re-handshake after pool reconnect 
                 # When a pool reconnects, it issues a NEW extranonce1.
@@ -2479,11 +2907,13 @@ class ProxySession:
                 # TCP connection.  Every miner handles a dropped connection
                 # by reconnecting and doing a fresh subscribe handshake,
                 # which picks up the new extranonce naturally.
+                # abort() drops the connection immediately (RST, no waiting on a
+                # graceful close); anything still buffered for the miner belongs
+                # to the old extranonce anyway.  close() keeps the graceful path.
                 try:
                     log("miner_disconnect_for_reconnect", sid=self.sid, pool=pool_key,
                         reason="pool_reconnected_new_extranonce")
-                    self.miner_w.close()
-                    await self.miner_w.wait_closed()
+                    self.miner_w.transport.abort()
                 except Exception as e:
                     log("miner_disconnect_for_reconnect_failed", sid=self.sid, pool=pool_key, err=str(e))
 
@@ -2494,11 +2924,18 @@ class ProxySession:
         await self.miner_ready.wait()
         last_seen = {"A": 0, "B": 0}
         current_pool = self.active_pool
-        ACTIVE_POOL.labels(pool="A").set(1 if current_pool == "A" else 0)
-        ACTIVE_POOL.labels(pool="B").set(1 if current_pool == "B" else 0)
+        set_active_pool_gauge(current_pool)
         last_switch_ts = time.monotonic()
         _last_credit_ts = time.monotonic()  # for time-based scheduler credits
+        _decay_pending = 0.0  # credited seconds not yet decayed (applied in >= 1s steps)
+        # Scheduler config is fixed for the life of the process: coerce it once
+        # here instead of on every tick. Only the slider override can change.
+        slice_s = max(1, int(self.cfg.sched.slice_seconds))
         min_switch = max(0, int(self.cfg.sched.min_switch_seconds))
+        _cfg_wA = max(0, int(getattr(self.cfg.sched, "wA", getattr(self.cfg.sched, "poolA_weight", 0))))
+        _cfg_wB = max(0, int(getattr(self.cfg.sched, "wB", getattr(self.cfg.sched, "poolB_weight", 0))))
+        _derived_key = None  # (wA, wB, current_pool) that _derived was computed for
+        _derived = None
 
         # Register this miner in the global fleet tracker
         _fleet_register(str(self.sid), current_pool)
@@ -2506,13 +2943,11 @@ class ProxySession:
         # been running at the target ratio, with a small bias toward its
         # starting pool.  This prevents miners from immediately switching
         # away from their initial pool assignment.
-        import random
         _override = read_weight_override()
         if _override is not None:
             _init_wA, _init_wB = _override
         else:
-            _init_wA = max(0, int(getattr(self.cfg.sched, "wA", getattr(self.cfg.sched, "poolA_weight", 0))))
-            _init_wB = max(0, int(getattr(self.cfg.sched, "wB", getattr(self.cfg.sched, "poolB_weight", 0))))
+            _init_wA, _init_wB = _cfg_wA, _cfg_wB
         _init_totw = _init_wA + _init_wB
         if _init_totw > 0:
             _seed_total = 60.0
@@ -2531,22 +2966,15 @@ class ProxySession:
                 self.accepted_diff_sum["B"] = _seed_total * _tB + _bias
         # Random jitter on first switch timing
         _jitter = random.uniform(0.0, 10.0)
-        last_switch_ts = time.monotonic() - (max(1, int(self.cfg.sched.slice_seconds)) - _jitter)
+        last_switch_ts = time.monotonic() - (slice_s - _jitter)
         log("scheduler_init", sid=self.sid, pool=current_pool, jitter=round(_jitter, 1),
             seedA=round(self.accepted_diff_sum.get("A", 0), 1),
             seedB=round(self.accepted_diff_sum.get("B", 0), 1))
 
         last_sent_seq = {"A": 0, "B": 0}
-        last_prune_mono = time.monotonic()
 
         while True:
-            # Periodic cleanup (every 60s) 
-            if time.monotonic() - last_prune_mono >= 60.0:
-                self.prune_stale_state()
-                last_prune_mono = time.monotonic()
             now = time.monotonic()
-            slice_s = max(1, int(self.cfg.sched.slice_seconds))
-            min_switch = max(0, int(self.cfg.sched.min_switch_seconds))
             switched_this_tick = False  # force-forward cached notify immediately after a switch
 
             # Failover: emergency switch if current pool is dead 
@@ -2560,78 +2988,76 @@ class ProxySession:
                     log("failover_emergency_switch", sid=self.sid,
                         dead_pool=current_pool, switching_to=other)
                     self.active_pool = other
-                    ACTIVE_POOL.labels(pool="A").set(1 if other == "A" else 0)
-                    ACTIVE_POOL.labels(pool="B").set(1 if other == "B" else 0)
+                    set_active_pool_gauge(other)
                     current_pool = other
                     last_switch_ts = now
                     self.last_switch_mono = now
                     switched_this_tick = True
                     await self.resend_active_notify_clean(other, reason="failover_emergency")
                 elif not self.pool_alive.get(other, False):
-                    # Both pools dead -- nothing to do, just wait.
-                    await asyncio.sleep(0.10)
+                    # Both pools dead -- nothing to do, just wait (a reconnect sets notify_event).
+                    try:
+                        await asyncio.wait_for(self.notify_event.wait(), timeout=SCHED_MAX_TICK_S)
+                    except asyncio.TimeoutError:
+                        pass
+                    self.notify_event.clear()
                     continue
 
             # Normal scheduling logic 
             # Read weights early so we can scale the min-switch time.
             _override = read_weight_override()
-            if _override is not None:
-                wA, wB = _override
-            else:
-                wA = max(0, int(getattr(self.cfg.sched, "wA", getattr(self.cfg.sched, "poolA_weight", 0))))
-                wB = max(0, int(getattr(self.cfg.sched, "wB", getattr(self.cfg.sched, "poolB_weight", 0))))
+            wA, wB = _override if _override is not None else (_cfg_wA, _cfg_wB)
             totw = wA + wB
 
-            # Scale min_switch by the active pool's target weight.
-            # At 15/85, a full 50s slice on Pool A massively overshoots
-            # (the miner should only spend ~15% of time on A).
-            # Floor of 10s prevents sub-second thrashing.
-            if totw > 0:
-                _active_frac = (wA / totw) if current_pool == "A" else (wB / totw)
-            else:
-                _active_frac = 0.5
-            _effective_min_switch = max(float(slice_s), min(float(min_switch), float(min_switch) * _active_frac * 2.0))
-
-            # ---- Time-based credits, decay, and ratio: run EVERY tick (0.1s) ----
-            # These must run every tick so the decay rate works as intended.
-            # At 0.9995 per tick with 10 ticks/sec, half-life is ~138 seconds.
+            # min_switch scaling, targets, urgency and hysteresis only change with
+            # the weights or the current pool; recompute them only then.
+            _derived_key_now = (wA, wB, current_pool)
+            if _derived_key_now != _derived_key:
+                _derived_key = _derived_key_now
+                _derived = sched_derived(wA, wB, current_pool, slice_s, min_switch)
+            _effective_min_switch, targetA, targetB, _urgency_threshold, hysteresis = _derived
+
+            # ---- Time-based credits, decay, and ratio: run EVERY tick ----
+            # Ticks are event-driven (notify / failover) with at most SCHED_MAX_TICK_S
+            # between them; credit and decay are scaled by the elapsed time, so the
+            # variable tick length does not change the ratio or the half-life.
             # Previously these were inside the min_switch gate and only ran
             # every 30-60s, making the effective half-life thousands of seconds
             # and causing the Scheduler Ratio to drift over hours.
             _tick_elapsed = now - _last_credit_ts
             _last_credit_ts = now
             _tick_credit = min(_tick_elapsed, 2.0)
-            SCHEDULER_TIME_SUM.labels(pool=current_pool).inc(_tick_credit)
+            SCHEDULER_TIME_SUM_BY_POOL[current_pool].inc(_tick_credit)
 
-            self.accepted_diff_sum[current_pool] = (
-                self.accepted_diff_sum.get(current_pool, 0.0) + _tick_credit
-            )
+            # Both keys always exist (set in __init__), so index directly and
+            # keep the decayed values as locals instead of re-reading the dict.
+            ads = self.accepted_diff_sum
+            ads[current_pool] += _tick_credit
 
             #_decay = 0.9999
             #self.accepted_diff_sum["A"] = self.accepted_diff_sum.get("A", 0.0) * _decay
             #self.accepted_diff_sum["B"] = self.accepted_diff_sum.get("B", 0.0) * _decay
 
-            _decay = 0.999 ** _tick_credit
-            self.accepted_diff_sum["A"] = self.accepted_diff_sum.get("A", 0.0) * _decay
-            self.accepted_diff_sum["B"] = self.accepted_diff_sum.get("B", 0.0) * _decay
-
-            diffA = float(self.accepted_diff_sum.get("A", 0.0))
-            diffB = float(self.accepted_diff_sum.get("B", 0.0))
+            # Decay per second of wall time, applied once a full second has
+            # accumulated so bursts of notify ticks don't each pay for it.
+            # Counters that have decayed to ~0 are pinned to 0.0.
+            _decay_pending += _tick_credit
+            diffA = ads["A"]
+            diffB = ads["B"]
+            if _decay_pending >= 1.0:
+                _decay = 0.999 ** _decay_pending
+                _decay_pending = 0.0
+                diffA = ads["A"] = diffA * _decay if diffA > 1e-9 else 0.0
+                diffB = ads["B"] = diffB * _decay if diffB > 1e-9 else 0.0
             tot = diffA + diffB
 
-            if totw > 0:
-                targetA = (wA / totw)
-                targetB = (wB / totw)
-            else:
-                targetA, targetB = 0.5, 0.5
-
             shareA = (diffA / tot) if tot > 0 else targetA
             shareB = (diffB / tot) if tot > 0 else targetB
 
             _fleet_update_share(str(self.sid), shareA)
             _avg_a, _avg_b = _fleet_avg_share()
-            SCHEDULER_SHARE.labels(pool="A").set(_avg_a)
-            SCHEDULER_SHARE.labels(pool="B").set(_avg_b)
+            SCHEDULER_SHARE_BY_POOL["A"].set(_avg_a)
+            SCHEDULER_SHARE_BY_POOL["B"].set(_avg_b)
 
             if (now - last_switch_ts) >= _effective_min_switch:
                 # Choose the pool that is behind in accepted difficulty share vs target.
@@ -2653,7 +3079,6 @@ class ProxySession:
                     # Seed with enough history to prevent urgent oscillation,
                     # biased toward current pool so the miner doesn't
                     # immediately switch away.
-                    import random
                     _seed_total = 60.0
                     if totw > 0:
                         _new_tA = wA / totw
@@ -2696,8 +3121,8 @@ class ProxySession:
 
                 if totw > 0:
                     # Recalculate targets with failover-adjusted weights
-                    targetA = (wA / totw)
-                    targetB = (wB / totw)
+                    if (wA, wB) != _derived_key[:2]:
+                        _, targetA, targetB, _urgency_threshold, hysteresis = sched_derived(wA, wB, current_pool, slice_s, min_switch)
 
                     # How far off-target is the current pool? (positive = over-target)
                     if current_pool == "A":
@@ -2711,14 +3136,7 @@ class ProxySession:
                     #   3) MAX_CONVERGE_DEVIATION can be configured to adjust the urgency threshold (default 2%).
                     time_on_pool = now - last_switch_ts
 
-                    # Compute minority_frac early -- needed by both urgency and hysteresis checks.
-                    minority_frac = min(targetA, targetB)
-
-                    # Scale urgency threshold by minority pool fraction.
-                    # At 50/50: threshold = max(0.05, 0.50) = 0.50 -- urgent almost never fires
-                    # At 80/20: threshold = max(0.05, 0.20) = 0.20 -- only truly large deviations
-                    # At 95/5:  threshold = max(0.05, 0.05) = 0.05 -- tighter at extreme ratios
-                    _urgency_threshold = max(MAX_CONVERGE_DEVIATION, minority_frac)
+                    # Urgency threshold scales with the minority pool fraction (see sched_derived()).
                     urgent = current_deviation > _urgency_threshold
 
                     if time_on_pool < slice_s and not urgent:
@@ -2738,16 +3156,8 @@ class ProxySession:
                             reason = "force_A_only"
 
                         # Hysteresis: don't switch to the minority pool for tiny
-                        # deviations. A 30s slice on the minority pool creates a
-                        # large overshoot; only switch when the deficit is big
-                        # enough to justify that slice.
-                        # At 15/85 on B: minority_frac=0.15, threshold=0.0375
-                        #   -- only switch B/A when shareA < 0.1125 (meaningfully behind)
-                        # At 50/50: minority_frac=0.50, threshold=0.125
-                        #   -- rarely triggers (deviation seldom that large at 50/50)
-
+                        # deviations (threshold from sched_derived()).
                         if prefer != current_pool and not urgent:
-                            hysteresis = min(minority_frac / 4.0, 0.04)
                             if abs(current_deviation) < hysteresis:
                                 prefer = current_pool
                                 reason = "hold_current_hysteresis"
@@ -2803,8 +3213,7 @@ class ProxySession:
                         last_switch_ts = now
                     else:
                         self.active_pool = pick
-                        ACTIVE_POOL.labels(pool="A").set(1 if pick == "A" else 0)
-                        ACTIVE_POOL.labels(pool="B").set(1 if pick == "B" else 0)
+                        set_active_pool_gauge(pick)
                         current_pool = pick
                         last_switch_ts = now
                         _fleet_register(str(self.sid), pick)  # update fleet tracker
@@ -2829,77 +3238,89 @@ class ProxySession:
                 # resend_active_notify_clean() already sent extranonce+diff+notify.
                 if switched_this_tick:
                     last_sent_seq[pick] = seq
-                    JOBS_FORWARDED.labels(pool=pick).inc()
+                    JOBS_FORWARDED_BY_POOL[pick].inc()
+                    # The resend already recorded its jobid; only record a newer one.
+                    if jid and (jid != self.last_forwarded_jobid or pick != self.last_forwarded_pool):
+                        self.record_job_owner(pick, jid)
                     self.last_forwarded_jobid = jid
                     self.last_forwarded_pool = pick
-                    if jid:
-                        self.job_owner[(pick, jid)] = pick
                     log("job_forwarded", sid=self.sid, pool=pick, jobid=jid, seq=seq)
                     log("job_forwarded_diff_state", sid=self.sid, pool=pick, jobid=jid, latest_diff=self.latest_diff.get(pick), last_dd=self.last_downstream_diff_by_pool.get(pick))
                 elif seq > last_sent_seq.get(pick, 0):
                     # Metrics truth: whichever pool we actually forward is 'active'.
                     self.active_pool = pick
-                    ACTIVE_POOL.labels(pool="A").set(1 if pick == "A" else 0)
-                    ACTIVE_POOL.labels(pool="B").set(1 if pick == "B" else 0)
-                    # Ensure miner has correct extranonce/diff for this pool before notify
-                    await self.maybe_send_downstream_extranonce(pick)
-                    await self.maybe_send_downstream_diff(pick)
+                    set_active_pool_gauge(pick)
                     if jid:
-                        self.job_owner[(pick, jid)] = pick
-
-                    # Force clean_jobs=True on downstream notify to avoid miners hashing stale jobs.
-                    try:
-                        nm = loads_json(raw)
-                        if nm.get("method") == "mining.notify":
-                            params = nm.get("params") or []
-                            if len(params) >= 1:
-                                if len(params) >= 9:
-                                    params[-1] = True
-                                else:
-                                    while len(params) < 9:
-                                        params.append(None)
-                                    params[-1] = True
-                                nm["params"] = params
-                                nm2 = sanitize_downstream_notification(nm)
-                                raw2 = dumps_json(nm2)
-                                await self.maybe_send_downstream_extranonce(pick)
-                                sent_diff = await self.maybe_send_downstream_diff(pick, force=(pick != self.last_forwarded_pool))
-                                if sent_diff:
-                                    await asyncio.sleep(0.25)
-                                await write_line(self.miner_w, raw2, "downstream")
-                                log("notify_clean_forced", sid=self.sid, pool=pick, jobid=jid)
-                            else:
-                                await self.maybe_send_downstream_extranonce(pick)
-                                sent_diff = await self.maybe_send_downstream_diff(pick, force=(pick != self.last_forwarded_pool))
-                                if sent_diff:
-                                    await asyncio.sleep(0.25)
-                                await write_line(self.miner_w, raw, "downstream")
-                        else:
-                            await self.maybe_send_downstream_extranonce(pick)
-                            sent_diff = await self.maybe_send_downstream_diff(pick, force=(pick != self.last_forwarded_pool))
-                            if sent_diff:
-                                await asyncio.sleep(0.25)
-                            await write_line(self.miner_w, raw, "downstream")
-                    except Exception as e:
-                        log("notify_clean_force_error", sid=self.sid, pool=pick, err=str(e))
-                        await self.maybe_send_downstream_extranonce(pick)
-                        sent_diff = await self.maybe_send_downstream_diff(pick, force=(pick != self.last_forwarded_pool))
-                        if sent_diff:
-                            await asyncio.sleep(0.25)
-                        await write_line(self.miner_w, raw, "downstream")
+                        self.record_job_owner(pick, jid)
+
+                    # Ensure miner has correct extranonce/diff for this pool before notify,
+                    # and force clean_jobs=True to avoid miners hashing stale jobs.
+                    # Write errors propagate and end the session.
+                    sent = await self.forward_notify(pick, raw, force_diff=(pick != self.last_forwarded_pool))
+                    if sent:
+                        log("notify_clean_forced", sid=self.sid, pool=pick, jobid=jid)
                     last_sent_seq[pick] = seq
-                    JOBS_FORWARDED.labels(pool=pick).inc()
-                    self.last_forwarded_jobid = jid
-                    self.last_forwarded_pool = pick
-                    log("job_forwarded", sid=self.sid, pool=pick, jobid=jid, seq=seq)
-                    log("job_forwarded_diff_state", sid=self.sid, pool=pick, jobid=jid, latest_diff=self.latest_diff.get(pick), last_dd=self.last_downstream_diff_by_pool.get(pick))
-
-            await asyncio.sleep(0.10)
+                    if sent is not None:
+                        JOBS_FORWARDED_BY_POOL[pick].inc()
+                        self.last_forwarded_jobid = jid
+                        self.last_forwarded_pool = pick
+                        log("job_forwarded", sid=self.sid, pool=pick, jobid=jid, seq=seq)
+                        log("job_forwarded_diff_state", sid=self.sid, pool=pick, jobid=jid, latest_diff=self.latest_diff.get(pick), last_dd=self.last_downstream_diff_by_pool.get(pick))
+
+            # Sleep until a pool sends a notify / changes liveness, or the next
+            # switch evaluation is due (capped so slider changes and credits
+            # are still picked up regularly). Once min_switch has passed and the
+            # scheduler chose to hold, nothing moves the deadline, so fall back
+            # to the regular tick instead of spinning on an already-past one.
+            _wait_s = last_switch_ts + _effective_min_switch - time.monotonic()
+            if _wait_s <= 0:
+                _wait_s = SCHED_MAX_TICK_S
+            _wait_s = min(max(_wait_s, 0.01), SCHED_MAX_TICK_S)
+            try:
+                await asyncio.wait_for(self.notify_event.wait(), timeout=_wait_s)
+            except asyncio.TimeoutError:
+                pass
+            self.notify_event.clear()
 
     # Main session runner
+    # Run the session until any of its tasks finishes (miner gone) or fails
     async def run(self):
+        if sys.version_info >= (3, 11):
+            # TaskGroup cancels and awaits the siblings on the first exit/failure.
+            try:
+                async with asyncio.TaskGroup() as tg:
+                    await self.start_tasks(lambda coro: tg.create_task(_end_session_when_done(coro)))
+            except BaseExceptionGroup as eg:
+                _, rest = eg.split(_SessionTaskDone)
+                if rest is not None:
+                    self._raise_first_task_error(list(rest.exceptions))
+            return
+
         tasks = set()
+        try:
+            await self.start_tasks(lambda coro: tasks.add(asyncio.create_task(coro)))
+            done, _pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # Also runs when this session is cancelled (shutdown), so the
+            # children never outlive it.
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+        self._raise_first_task_error([t.exception() for t in done
+                                      if not t.cancelled() and t.exception() is not None])
+
+    # Several tasks can fail together (e.g. forward_jobs on a write error and
+    # miner_to_pools on the reset); handle_miner() logs the first as session_error,
+    # so log the others here before it is raised.
+    def _raise_first_task_error(self, excs: list[BaseException]) -> None:
+        if not excs:
+            return
+        for exc in excs[1:]:
+            log("session_error", peer=self.sid, err=str(exc), err_type=type(exc).__name__, secondary=True)
+        raise excs[0]
 
+    # Connect the upstream pools and spawn the session's tasks
+    async def start_tasks(self, spawn) -> None:
         # Only connect to pools that have weight > 0.
         # At 100/0, skip Pool B entirely (avoids crash if Pool B is unreachable).
         # At 0/100, skip Pool A entirely.
@@ -2915,12 +3336,9 @@ class ProxySession:
                 self.pool_alive["A"] = False
                 self.pool_fail_count["A"] = 1
                 self.pool_last_fail_mono["A"] = time.monotonic()
-                # Create a dummy reader so pool_reader_with_reconnect
+                # self.rA stays None, so pool_reader_with_reconnect
                 # skips straight to its reconnect loop.
-                self.rA = asyncio.StreamReader()
-                self.rA.feed_eof()  # immediately signals "disconnected"
-            tasks.add(asyncio.create_task(
-                self.pool_reader_with_reconnect("A", self.rA)))
+            spawn(self.pool_reader_with_reconnect("A", self.rA))
         else:
             self.pool_alive["A"] = False
             log("pool_skipped_zero_weight", pool="A", wA=self.cfg.sched.wA)
@@ -2935,26 +3353,14 @@ class ProxySession:
                 self.pool_alive["B"] = False
                 self.pool_fail_count["B"] = 1
                 self.pool_last_fail_mono["B"] = time.monotonic()
-                self.rB = asyncio.StreamReader()
-                self.rB.feed_eof()
-            tasks.add(asyncio.create_task(
-                self.pool_reader_with_reconnect("B", self.rB)))
+            spawn(self.pool_reader_with_reconnect("B", self.rB))
         else:
             self.pool_alive["B"] = False
             log("pool_skipped_zero_weight", pool="B", wB=self.cfg.sched.wB)
 
-        tasks.add(asyncio.create_task(self.miner_to_pools()))
-        tasks.add(asyncio.create_task(self.forward_jobs()))
-
-        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
-
-        for t in pending:
-            t.cancel()
-        for t in done:
-            if not t.cancelled():
-                exc = t.exception()
-                if exc:
-                    raise exc
+        spawn(self.miner_to_pools())
+        spawn(self.forward_jobs())
+        spawn(self.state_report_loop())
 
     # Close all connections
     async def close(self):
@@ -2971,6 +3377,16 @@ class ProxySession:
                 except Exception:
                     pass
 
+# Tasks main() cancels on shutdown: miner sessions and the oracle loop.
+# Cancelling a session cancels its own pool/scheduler tasks.
+_owned_tasks: set[asyncio.Task] = set()
+
+def spawn_owned(coro) -> asyncio.Task:
+    t = asyncio.create_task(coro)
+    _owned_tasks.add(t)
+    t.add_done_callback(_owned_tasks.discard)
+    return t
+
 # Handle incoming miner connection
 async def handle_miner(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, cfg: AppCfg):
     peer = writer.get_extra_info("peername")
@@ -2979,32 +3395,50 @@ async def handle_miner(reader: asyncio.StreamReader, writer: asyncio.StreamWrite
 
     CONN_DOWNSTREAM.inc()
     log("miner_connected", peer=str(peer))
+    tune_socket(writer, "downstream")
 
     sess = ProxySession(cfg, reader, writer, sid=str(peer))
+    # start_server runs each connection as its own task; register it for shutdown.
+    _task = asyncio.current_task()
+    _owned_tasks.add(_task)
     try:
         await sess.run()
     except Exception as e:
         log("session_error", peer=str(peer), err=str(e))
     finally:
-
-        # Clear per-session downstream state so reconnects start clean.
-        try:
-            sess.last_downstream_diff_by_pool = {"A": None, "B": None}
-            sess.last_downstream_en1 = None
-            sess.last_downstream_en2s = None
-            sess.last_downstream_extranonce = None
-        except Exception:
-            pass
-
+        # No per-session downstream state to clear: every miner connection gets a
+        # fresh ProxySession, so a reconnect already starts clean.
         CONN_DOWNSTREAM.dec()
         CONN_UPSTREAM.labels(pool="A").dec()
         CONN_UPSTREAM.labels(pool="B").dec()
         await sess.close()
+        _owned_tasks.discard(_task)
         log("miner_disconnected", peer=str(peer))
 
+# SIGINT/SIGTERM -> set the stop event main() waits on
+def install_stop_handlers(loop: asyncio.AbstractEventLoop, stop: asyncio.Event) -> None:
+    # add_signal_handler callbacks already run on the loop (delivered through
+    # its own wakeup fd), so they set the event directly.
+    def _stop():
+        log("shutdown_signal")
+        stop.set()
+
+    # signal.signal handlers can interrupt the loop mid-step: hand off to it.
+    def _stop_threadsafe(*_args):
+        log("shutdown_signal")
+        loop.call_soon_threadsafe(stop.set)
+
+    for s in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(s, _stop)
+        except NotImplementedError:
+            # Windows event loops have no add_signal_handler.
+            signal.signal(s, _stop_threadsafe)
+
 # Main entry point
-async def main():
+async def main(stop: Optional[asyncio.Event] = None):
     global WEIGHTS_OVERRIDE_PATH, ORACLE_MODE_PATH
+    start_log_writer()
     cfg_path = os.environ.get("DPMP_CONFIG", os.path.join(os.path.dirname(__file__), "config_v2.json"))
 
     WEIGHTS_OVERRIDE_PATH = os.path.join(os.path.dirname(cfg_path), "weights_override.json")
@@ -3080,19 +3514,14 @@ async def main():
         upstreamB=f"{cfg.poolB.host}:{cfg.poolB.port}",
         mode="dual_pool_scheduling_handshake_forward",
         weights=f"{cfg.sched.wA}:{cfg.sched.wB}",
+        event_loop=type(asyncio.get_running_loop()).__module__,
     )
 
-    stop = asyncio.Event()
-    def _stop(*_args):
-        log("shutdown_signal")
-        stop.set()
-
-    loop = asyncio.get_running_loop()
-    for s in (signal.SIGINT, signal.SIGTERM):
-        try:
-            loop.add_signal_handler(s, _stop)
-        except NotImplementedError:
-            pass
+    # The __main__ block passes a stop event whose handlers were installed
+    # before the loop started; otherwise install them now.
+    if stop is None:
+        stop = asyncio.Event()
+        install_stop_handlers(asyncio.get_running_loop(), stop)
 
     # Keep running until stopped
     serve_task = asyncio.create_task(server.serve_forever())
@@ -3102,15 +3531,12 @@ async def main():
     # Whether it actually writes weights_override.json depends on oracle_mode.json
     # (checked inside oracle_poll_loop each cycle).
     oracle_task = None
-    chain_a = getattr(cfg.poolA, "chain", "").upper()
-    chain_b = getattr(cfg.poolB, "chain", "").upper()
-    chain_valid = sorted([chain_a, chain_b]) == ["BCH", "BTC"]
-    if chain_valid:
-        oracle_task = asyncio.create_task(oracle_poll_loop(cfg))
+    if cfg.chains_valid:
+        oracle_task = spawn_owned(oracle_poll_loop(cfg))
         log("oracle_task_started", auto_balance=cfg.sched.auto_balance,
             reason="chain config valid, oracle always collects data")
     else:
-        log("oracle_disabled_invalid_chains", chain_a=chain_a, chain_b=chain_b,
+        log("oracle_disabled_invalid_chains", chain_a=cfg.poolA.chain, chain_b=cfg.poolB.chain,
             reason="need exactly one BTC and one BCH pool for oracle")
 
     try:
@@ -3121,40 +3547,27 @@ async def main():
         try:
             log("shutdown_server_close_begin")
             server.close()
-            try:
-                await asyncio.wait_for(server.wait_closed(), timeout=2.0)
-                log("shutdown_server_close_done")
-            except asyncio.TimeoutError:
-                log("shutdown_server_close_timeout")
         except Exception as e:
             log("shutdown_server_close_error", err=str(e))
 
-        # Stop the serve_forever loop        
-        log("shutdown_serve_task_cancel_begin")
-        try:
-            serve_task.cancel()
-            await asyncio.wait_for(asyncio.gather(serve_task, return_exceptions=True), timeout=2.0)
-            log("shutdown_serve_task_cancel_done")
-        except asyncio.TimeoutError:
-            log("shutdown_serve_task_cancel_timeout")
-        except Exception as e:
-            log("shutdown_serve_task_error", err=str(e))
-
+        # Cancel the serve_forever loop, the oracle and every miner session at
+        # once and wait for them (and the server close) under one 5s budget.
+        # serve_task is cancelled explicitly: on the stdlib loop server.close()
+        # ends serve_forever() by itself, but on uvloop it does not.
         log("shutdown_cancel_tasks")
         if oracle_task is not None and not oracle_task.done():
-            oracle_task.cancel()
             log("oracle_task_cancelled")
-        current_task = asyncio.current_task()
-        tasks = [t for t in asyncio.all_tasks() if t is not current_task and t is not serve_task and not t.done()]
-
+        tasks = [t for t in (serve_task, *_owned_tasks) if not t.done()]
         for t in tasks:
             t.cancel()
-
-        if tasks:
-            try:
-                await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), timeout=5.0)
-            except asyncio.TimeoutError:
-                log("shutdown_timeout", n=len(tasks))
+        closed = asyncio.ensure_future(server.wait_closed())
+        done, pending = await asyncio.wait([closed, *tasks], timeout=5.0)
+        for t in done:
+            if not t.cancelled():
+                t.exception()  # retrieved, so asyncio doesn't warn about it
+        if pending:
+            closed.cancel()
+            log("shutdown_timeout", n=len(pending))
 
         log("shutdown_done")
 
@@ -3162,7 +3575,15 @@ async def main():
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        if sys.version_info >= (3, 11):
+            # Signal handlers go on the runner's loop before main() is scheduled,
+            # so a signal during startup still reaches the stop event.
+            with asyncio.Runner(loop_factory=uvloop.new_event_loop if uvloop is not None else None) as runner:
+                _stop_event = asyncio.Event()
+                install_stop_handlers(runner.get_loop(), _stop_event)
+                runner.run(main(_stop_event))
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         log("shutdown_keyboard_interrupt")
     except Exception as e:
@@ -3172,3 +3593,4 @@ if __name__ == "__main__":
         raise
     finally:
         log("process_exiting")
+        stop_log_writer()
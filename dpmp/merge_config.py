@@ -24,42 +24,168 @@ How it works:
        logs show exactly what changed.
 
 This script is safe to run on every container start – if nothing is
-missing it simply exits with no changes.
+missing it simply exits with no changes.  When neither file has changed
+since the last run that found the config up to date (same mtime and size,
+recorded in a small stamp file in the temp dir), it exits without parsing
+either file.
 """
 
 import json
 import sys
 import os
 import shutil
+import tempfile
 from datetime import datetime, timezone
 
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+STAMP_PATH = os.path.join(tempfile.gettempdir(), ".merge_config_stamp.json")
+BACKUP_KEEP = 5  # newest <config>.backup.* files kept; older ones are removed
+
+
+def file_key(path: str) -> list:
+    """(path, mtime_ns, size) identifying one version of a file."""
+    st = os.stat(path)
+    return [os.path.abspath(path), st.st_mtime_ns, st.st_size]
+
+
+def load_json(path: str):
+    """Parse a JSON file from one binary read (orjson when available)."""
+    with open(path, "rb") as f:
+        buf = f.read()
+    if orjson is not None:
+        return orjson.loads(buf)
+    return json.loads(buf.decode("utf-8"))
+
+
+def read_stamp() -> dict:
+    try:
+        with open(STAMP_PATH, "r", encoding="utf-8") as f:
+            stamp = json.load(f)
+        return stamp if isinstance(stamp, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def write_stamp(template_path: str, user_path: str) -> None:
+    """Record that user_path is up to date with template_path (best effort)."""
+    stamp = read_stamp()
+    try:
+        stamp[os.path.abspath(user_path)] = {
+            "template": file_key(template_path),
+            "user": file_key(user_path),
+        }
+        tmp = STAMP_PATH + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(stamp, f)
+        os.replace(tmp, STAMP_PATH)
+    except OSError:
+        pass
+
+
+def copy_file(src: str, dst: str) -> None:
+    """
+    Copy src to dst with metadata, like shutil.copy2, but via
+    os.copy_file_range where available so the kernel can clone the data
+    (copy-on-write on Btrfs/XFS) instead of copying it through userspace.
+    """
+    copy_range = getattr(os, "copy_file_range", None)
+    if copy_range is None:
+        shutil.copy2(src, dst)
+        return
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            remaining = os.fstat(s.fileno()).st_size
+            while remaining > 0:
+                n = copy_range(s.fileno(), d.fileno(), remaining)
+                if n == 0:
+                    break
+                remaining -= n
+        if remaining > 0:
+            raise OSError("short copy_file_range")
+        shutil.copystat(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def prune_backups(user_path: str) -> None:
+    """Keep only the newest BACKUP_KEEP timestamped backups of user_path."""
+    d = os.path.dirname(user_path) or "."
+    prefix = os.path.basename(user_path) + ".backup."
+    try:
+        # Timestamps are fixed-width UTC, so name order is age order.
+        olds = sorted(p for p in os.listdir(d) if p.startswith(prefix))
+    except OSError:
+        return
+    for p in olds[:-BACKUP_KEEP]:
+        try:
+            os.unlink(os.path.join(d, p))
+            print(f"[merge_config] Removed old backup: {os.path.join(d, p)}")
+        except OSError:
+            pass
+
+
+def format_value(value) -> str:
+    """JSON-style text for a log line; scalars skip the json encoder."""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    # Strings (escaping) and lists keep the json path.
+    return json.dumps(value)
+
+
+def section_items(template: dict, user: dict):
+    """Iterator over the template keys of one section that deep_merge must visit."""
+    if template.keys() <= user.keys():
+        # Nothing missing at this level (C-level set check): only nested
+        # sections can still need work.
+        return iter([(k, v) for k, v in template.items() if isinstance(v, dict)])
+    return iter(template.items())
+
 
 def deep_merge(template: dict, user: dict, path: str = "") -> list[str]:
     """
-    Recursively add missing keys from 'template' into 'user'.
+    Add missing keys from 'template' into 'user', descending into nested
+    sections (an explicit stack instead of recursion).
 
     Returns a list of human-readable strings describing each key that
     was added, e.g. "scheduler.auto_balance = false".
     """
     added = []
+    # One (template items iterator, user section, key prefix) per open section;
+    # descending pushes, exhausting pops, so keys are reported in template order.
+    stack = [(section_items(template, user), user, path)]
 
-    for key, default_value in template.items():
-        full_key = f"{path}.{key}" if path else key
+    while stack:
+        items, usr, prefix = stack[-1]
+        for key, default_value in items:
+            full_key = f"{prefix}.{key}" if prefix else key
 
-        if key not in user:
-            # ---- Key is missing from user config: insert default ----
-            user[key] = default_value
-            # Format the value for the log message
-            if isinstance(default_value, dict):
-                added.append(f"  + {full_key} = {{...}}  (new section)")
-            else:
-                added.append(f"  + {full_key} = {json.dumps(default_value)}")
+            if key not in usr:
+                # ---- Key is missing from user config: insert default ----
+                usr[key] = default_value
+                # Format the value for the log message
+                if isinstance(default_value, dict) and default_value:
+                    added.append(f"  + {full_key} = {{...}}  (new section)")
+                elif isinstance(default_value, dict):
+                    added.append(f"  + {full_key} = {{}}  (empty section)")
+                else:
+                    added.append(f"  + {full_key} = {format_value(default_value)}")
 
-        elif isinstance(default_value, dict) and isinstance(user[key], dict):
-            # ---- Both sides are dicts: recurse into the section ----
-            added.extend(deep_merge(default_value, user[key], full_key))
+            elif isinstance(default_value, dict) and isinstance(usr[key], dict):
+                # ---- Both sides are dicts: descend into the section ----
+                stack.append((section_items(default_value, usr[key]), usr[key], full_key))
+                break
 
-        # else: key exists and is not a nested dict — leave user's value alone
+            # else: key exists and is not a nested dict — leave user's value alone
+        else:
+            stack.pop()
 
     return added
 
@@ -79,34 +205,60 @@ def main():
               file=sys.stderr)
         sys.exit(1)
 
-    with open(template_path, "r", encoding="utf-8") as f:
-        template = json.load(f)
-
     # --- Load user config ---
     if not os.path.isfile(user_path):
         print(f"[merge_config] No user config at {user_path}, skipping merge.")
         sys.exit(0)
 
-    with open(user_path, "r", encoding="utf-8") as f:
-        user_cfg = json.load(f)
+    # --- Neither file changed since the last up-to-date run: nothing to parse ---
+    if read_stamp().get(os.path.abspath(user_path)) == {
+        "template": file_key(template_path),
+        "user": file_key(user_path),
+    }:
+        print("[merge_config] Config is up to date — no new fields needed.")
+        sys.exit(0)
+
+    template = load_json(template_path)
+
+    user_cfg = load_json(user_path)
 
     # --- Merge ---
     added = deep_merge(template, user_cfg)
 
     if not added:
+        write_stamp(template_path, user_path)
         print("[merge_config] Config is up to date — no new fields needed.")
         sys.exit(0)
 
     # --- Backup the original before writing ---
-    timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
-    backup_path = f"{user_path}.backup.{timestamp}"
-    shutil.copy2(user_path, backup_path)
-    print(f"[merge_config] Backup saved: {backup_path}")
-
-    # --- Write merged config ---
-    with open(user_path, "w", encoding="utf-8") as f:
-        json.dump(user_cfg, f, indent=2, ensure_ascii=False)
-        f.write("\n")
+    # Skipped when the only additions are empty placeholder sections: no
+    # user-visible setting changes, so there is nothing worth restoring.
+    if all(line.endswith("(empty section)") for line in added):
+        print("[merge_config] Only empty sections added — skipping backup.")
+    else:
+        timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        backup_path = f"{user_path}.backup.{timestamp}"
+        # A hardlink is enough: the merged config is written to a new file and
+        # renamed over user_path, so the linked inode keeps the original bytes.
+        try:
+            os.link(user_path, backup_path)
+        except OSError:
+            copy_file(user_path, backup_path)
+        print(f"[merge_config] Backup saved: {backup_path}")
+        prune_backups(user_path)
+
+    # --- Write merged config (temp file + rename, so a crash can't leave it half-written) ---
+    if orjson is not None:
+        data = orjson.dumps(user_cfg, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE)
+    else:
+        data = (json.dumps(user_cfg, indent=2, ensure_ascii=False) + "\n").encode("utf-8")
+    tmp = user_path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    shutil.copymode(user_path, tmp)
+    os.replace(tmp, user_path)
+
+    write_stamp(template_path, user_path)
 
     print(f"[merge_config] Added {len(added)} new field(s) to {user_path}:")
     for line in added:
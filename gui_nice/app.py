@@ -5,6 +5,7 @@ Developed with NiceGUI (https://nicegui.io)
 """
 
 import asyncio
+import functools
 import io
 import json
 import os
@@ -13,13 +14,20 @@ import time
 import re
 import zipfile
 
+from collections import deque
 from datetime import date 
 from dataclasses import dataclass
 from typing import Any, Dict, Optional
 from urllib.request import urlopen, Request
 
+import aiohttp
 from nicegui import ui, app
 
+try:
+    import orjson  # type: ignore
+except Exception:
+    orjson = None
+
 CONFIG_PATH = os.environ.get("DPMP_CONFIG_PATH", os.path.expanduser("~/dpmp/dpmp/config_v2.json"))
 METRICS_URL  = os.environ.get("DPMP_METRICS_URL", "http://127.0.0.1:9210/metrics")
 DPMP_LOG_PATH = os.environ.get("DPMP_LOG_PATH", os.path.expanduser("~/dpmp/dpmpv2_run.log"))
@@ -34,63 +42,12 @@ POLL_S = float(os.environ.get("NICEGUI_POLL_S", "2.0"))
 
 #DARK_KEY = 'dpmp_dark_mode'
 
-ui.add_head_html("""
-<style>
-/* Restore basic HTML formatting inside the About page */
-.about-content ul { list-style: disc; margin: 0.5rem 0 0.75rem 1.25rem; padding-left: 1.25rem; }
-.about-content ol { list-style: decimal; margin: 0.5rem 0 0.75rem 1.25rem; padding-left: 1.25rem; }
-.about-content li { margin: 0.15rem 0; }
-.about-content p  { margin: 0.6rem 0; }
-.about-content h3 { font-size: 1.25rem; font-weight: 700; margin: 0.75rem 0 0.5rem 0; }
-.about-content h4 { font-size: 1.05rem; font-weight: 600; margin: 0.75rem 0 0.4rem 0; }
-.about-content hr { margin: 0.9rem 0; opacity: 0.35; }
-@media (max-width: 768px) {
-  .hide-on-mobile { display: none !important; }   
-
-</style>
-
-<script>
-
-(function () {
-  const KEY = 'dpmp_dark_mode';
-
-  function desiredIsDark() {
-    const v = localStorage.getItem(KEY);
-    return (v === '1' || v === 'true');
-  }
-
-  function applyThemeAndSwitch() {
-    try {
-      const isDark = desiredIsDark();
-
-      // Apply theme if Quasar is ready
-      if (window.Quasar && Quasar.Dark) {
-        Quasar.Dark.set(isDark);
-      }
-
-      // Sync switch state (NiceGUI/Quasar may re-render, so keep forcing it)
-      const input = document.querySelector('#dpmp_dark_switch input[type="checkbox"]');
-      if (input && input.checked !== isDark) {
-        input.checked = isDark;
-      }
-
-      // "ready" when Quasar exists AND switch input exists
-      return !!(window.Quasar && Quasar.Dark) && !!input;
-    } catch (e) {
-      return false;
-    }
-  }
-
-  // Try repeatedly for a short time to survive late Quasar init + component re-renders
-  let tries = 0;
-  const timer = setInterval(() => {
-    tries++;
-    const ok = applyThemeAndSwitch();
-    if (ok || tries >= 50) clearInterval(timer); // ~5s
-  }, 100);
-})();
-</script>
-""")
+# theme CSS + dark-mode bootstrap live in gui_nice/static so browsers cache them
+# across page loads instead of receiving them inline every time
+ui.add_head_html(
+    '<link rel="stylesheet" href="/static/theme.css">'
+    '<script src="/static/dark_init.js" defer></script>'
+)
 
 # timestamp in UTC format
 def now_utc() -> str:
@@ -119,18 +76,35 @@ def systemd_is_active(unit: str) -> bool:
     except Exception:
         return False
 
+# unit state rarely changes; reuse the last answer for this long (seconds)
+_SYSTEMD_TTL_S = 10.0
+_systemd_cache: dict[str, tuple[float, bool]] = {}
+
+# non-blocking systemd_is_active: systemctl runs in a worker thread, result cached for _SYSTEMD_TTL_S
+async def systemd_is_active_async(unit: str) -> bool:
+    now = time.monotonic()
+    hit = _systemd_cache.get(unit)
+    if hit is not None and (now - hit[0]) < _SYSTEMD_TTL_S:
+        return hit[1]
+    active = await asyncio.to_thread(systemd_is_active, unit)
+    _systemd_cache[unit] = (time.monotonic(), active)
+    return active
+
 # extract single gauge value from raw Prometheus text format
-def _prom_gauge_value(text: str, name: str, pool: str | None = None) -> float | None:
+# compiled once per (name, pool); the set of gauges the GUI asks for is small and fixed
+@functools.lru_cache(maxsize=128)
+def _compile_gauge_re(name: str, pool: str | None) -> re.Pattern[str]:
     if pool is None:
         # e.g. dpmp_downstream_connections 1.0
-        m = re.search(rf'^{re.escape(name)}\s+([0-9eE\+\-\.]+)\s*$', text, flags=re.M)
-    else:
-        # e.g. dpmp_active_pool{pool="A"} 1.0
-        m = re.search(
-            rf'^{re.escape(name)}\{{[^}}]*pool="{re.escape(pool)}"[^}}]*\}}\s+([0-9eE\+\-\.]+)\s*$',
-            text,
-            flags=re.M,
-        )
+        return re.compile(rf'^{re.escape(name)}\s+([0-9eE\+\-\.]+)\s*$', flags=re.M)
+    # e.g. dpmp_active_pool{pool="A"} 1.0
+    return re.compile(
+        rf'^{re.escape(name)}\{{[^}}]*pool="{re.escape(pool)}"[^}}]*\}}\s+([0-9eE\+\-\.]+)\s*$',
+        flags=re.M,
+    )
+
+def _prom_gauge_value(text: str, name: str, pool: str | None = None) -> float | None:
+    m = _compile_gauge_re(name, pool).search(text)
     if not m:
         return None
     try:
@@ -138,6 +112,45 @@ def _prom_gauge_value(text: str, name: str, pool: str | None = None) -> float |
     except Exception:
         return None
 
+_POOL_LABEL_RE = re.compile(r'pool="([^"]*)"')
+
+# metric names the home/stats panels read; everything else is skipped before splitting
+_PROM_WANTED = (
+    "dpmp_active_pool",
+    "dpmp_downstream_connections",
+    "dpmp_shares_accepted_total",
+    "dpmp_shares_rejected_total",
+    "dpmp_jobs_forwarded_total",
+    "dpmp_accepted_difficulty_sum_total",
+    "dpmp_scheduler_share",
+)
+
+# parse raw Prometheus text once into {(name, pool): value}
+# (only _PROM_WANTED metrics; pool is None for unlabeled samples; labeled samples without a pool label are skipped)
+def parse_prom_all(text: str) -> dict[tuple[str, str | None], float]:
+    out: dict[tuple[str, str | None], float] = {}
+    for line in text.splitlines():
+        # also rejects blank lines and # HELP / # TYPE comments
+        if not line.startswith(_PROM_WANTED):
+            continue
+        try:
+            brace = line.find("{")
+            if brace < 0:
+                name, val = line.split(None, 1)
+                pool = None
+            else:
+                close = line.rfind("}")
+                m = _POOL_LABEL_RE.search(line, brace, close)
+                if not m:
+                    continue
+                name, pool = line[:brace], m.group(1)
+                val = line[close + 1:]
+            # first sample wins, like the regex lookup it replaces
+            out.setdefault((name, pool), float(val.split()[0]))
+        except (ValueError, IndexError):
+            continue
+    return out
+
 # extract first matching float value from parsed Prometheus metrics dict
 def prom_first_float(metrics: dict, name: str, labels: dict | None = None) -> float | None:
     rows = metrics.get(name) or []
@@ -156,31 +169,83 @@ def prom_first_float(metrics: dict, name: str, labels: dict | None = None) -> fl
         return None
 
 # read text file with max size limit
+# only reads capped at this size are memoized (the full-log download is not kept in memory)
+_FILE_CACHE_MAX_BYTES = 1_000_000
+# (path, max_bytes) -> (mtime_ns, size, text)
+_file_cache: dict[tuple[str, int], tuple[int, int, str]] = {}
+
 def read_text_file(path: str, max_bytes: int = 200_000) -> str:
     try:
+        st = os.stat(path)
+        ck = (path, max_bytes)
+        hit = _file_cache.get(ck)
+        if hit is not None and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+            return hit[2]
         with open(path, "rb") as f:
             data = f.read()
         if len(data) > max_bytes:
             data = data[-max_bytes:]
-        return data.decode("utf-8", errors="replace")
+        text = data.decode("utf-8", errors="replace")
+        if max_bytes <= _FILE_CACHE_MAX_BYTES:
+            _file_cache[ck] = (st.st_mtime_ns, st.st_size, text)
+        return text
     except FileNotFoundError:
         return f"[missing] {path}"
     except Exception as e:
         return f"[error reading {path}] {e}"
 
+# read only what was appended to a growing log since the last call.
+# tail is caller-owned state: {"off": next read offset, "ino": inode last read}.
+# Returns (new_bytes, reset). reset=True means whatever the caller built from earlier
+# reads is stale: first call, file replaced (new inode) or truncated, or more than
+# max_bytes appended so the read skipped ahead to the last max_bytes.
+def tail_log_delta(path: str, tail: Dict[str, Any], max_bytes: int = 200_000) -> tuple[bytes, bool]:
+    st = os.stat(path)
+    size = st.st_size
+    off = tail.get("off", 0)
+    reset = False
+    if st.st_ino != tail.get("ino") or size < off:
+        off = 0
+        reset = True
+    tail["ino"] = st.st_ino
+    tail["off"] = off
+    if size == off:
+        return b"", reset
+    start = off
+    if size - off > max_bytes:
+        start = size - max_bytes
+        reset = True
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(size - start)
+        tail["off"] = f.tell()
+    return data, reset
+
 # read JSON file
 def read_json(path: str) -> Dict[str, Any]:
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
 # read weight defaults from config_v2.json
+# (mtime_ns, size, wA, wB) from the last successful get_config_weights() parse
+_config_weights_cache: tuple[int, int, int, int] | None = None
+
 def get_config_weights() -> tuple[int, int]:
-    """Read Pool A / Pool B weights from config_v2.json. Returns (wA, wB)."""
+    """Read Pool A / Pool B weights from config_v2.json. Returns (wA, wB).
+
+    The parsed weights are reused until the file's mtime or size changes.
+    """
+    global _config_weights_cache
     try:
+        st = os.stat(CONFIG_PATH)
+        hit = _config_weights_cache
+        if hit is not None and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+            return (hit[2], hit[3])
         cfg = read_json(CONFIG_PATH)
         sched = cfg.get("scheduler", {})
         wA = int(sched.get("poolA_weight", 50))
         wB = int(sched.get("poolB_weight", 50))
+        _config_weights_cache = (st.st_mtime_ns, st.st_size, wA, wB)
         return (wA, wB)
     except Exception:
         return (50, 50)
@@ -309,9 +374,21 @@ def delete_oracle_mode() -> None:
 # write JSON file atomically
 def write_json_atomic(path: str, obj: Dict[str, Any]) -> None:
     tmp = f"{path}.tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(obj, f, indent=2, sort_keys=False)
-        f.write("\n")
+    if orjson is not None:
+        # same 2-space layout and trailing newline as the json.dump path, written with
+        # raw fds (no Python file object); 0o666 & umask matches what open() would create
+        data = orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE)
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+    else:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(obj, f, indent=2, sort_keys=False)
+            f.write("\n")
     os.replace(tmp, path)
 
 # Save oracle chart history to disk (survives browser refresh)
@@ -357,7 +434,7 @@ def clear_oracle_chart_history() -> None:
     except Exception:
         pass
 
-# HTTP GET with timeout
+# HTTP GET with timeout (blocking; only for one-off reads while the page is built)
 def http_get_text(url: str, timeout_s: float = 3.0) -> str:
     req = Request(url, headers={"User-Agent": "dpmpv2-nicegui"})
     try:
@@ -367,6 +444,68 @@ def http_get_text(url: str, timeout_s: float = 3.0) -> str:
         # dpmpv2 restarts will temporarily drop the metrics listener (Errno 111)
         return ""
 
+# Shared keep-alive session for the periodic metrics polls (created on first use,
+# inside NiceGUI's event loop), so each poll reuses the same TCP connection.
+_http_session: aiohttp.ClientSession | None = None
+
+# HTTP GET with timeout, without blocking the GUI event loop
+async def http_get_text_async(url: str, timeout_s: float = 3.0) -> str:
+    global _http_session
+    try:
+        if _http_session is None or _http_session.closed:
+            _http_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=4, keepalive_timeout=30),
+                headers={"User-Agent": "dpmpv2-nicegui"},
+            )
+        async with _http_session.get(url, timeout=aiohttp.ClientTimeout(total=timeout_s)) as r:
+            if r.status != 200:
+                return ""
+            return await r.text(errors="replace")
+    except Exception:
+        # dpmpv2 restarts will temporarily drop the metrics listener (Errno 111)
+        return ""
+
+# close the shared HTTP session on GUI shutdown
+async def _close_http_session() -> None:
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+
+app.on_shutdown(_close_http_session)
+
+# The home, stats and oracle panels all poll METRICS_URL on their own timers.
+# A scrape younger than this is handed to every caller instead of refetching.
+_METRICS_MAX_AGE_S = 1.0
+_metrics_shared: Dict[str, Any] = {"raw": "", "ts": 0.0, "task": None}
+
+async def _fetch_metrics_into_cache() -> str:
+    raw = await http_get_text_async(METRICS_URL)
+    _metrics_shared["raw"] = raw
+    _metrics_shared["ts"] = time.monotonic()
+    return raw
+
+# metrics text shared across panels: reuse a fresh scrape, or join the one already in flight
+async def get_metrics_shared(max_age_s: float = _METRICS_MAX_AGE_S) -> str:
+    if (time.monotonic() - _metrics_shared["ts"]) < max_age_s:
+        return _metrics_shared["raw"]
+    task = _metrics_shared["task"]
+    if task is None or task.done():
+        task = asyncio.create_task(_fetch_metrics_into_cache())
+        _metrics_shared["task"] = task
+    # shield: one caller being cancelled must not cancel the scrape the others are awaiting
+    return await asyncio.shield(task)
+
+# key="value" pairs inside a label set (values may contain escaped quotes)
+_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+# BTC/BCH wallet addresses for log redaction, one alternation so the log is scanned once:
+# bech32 | cashaddr with prefix | short cashaddr | legacy P2PKH/P2SH
+_WALLET_RE = re.compile(
+    r'\bbc1[qpzry9x8gf2tvdw0s3jn54khce6mua7l]{38,58}\b'
+    r'|\bbitcoincash:[qp][a-z0-9]{41,}\b'
+    r'|\b[qp][a-z0-9]{41,55}\b'
+    r'|\b[13][a-km-zA-HJ-NP-Z1-9]{25,34}\b'
+)
+
 # parse a single line of Prometheus text format
 def parse_prom_line(line: str) -> Optional[tuple[str, Dict[str, str], float]]:
     line = line.strip()
@@ -383,26 +522,7 @@ def parse_prom_line(line: str) -> Optional[tuple[str, Dict[str, str], float]]:
     if "{" in left and left.endswith("}"):
         name, rest = left.split("{", 1)
         rest = rest[:-1]
-        labels: Dict[str, str] = {}
-        if rest.strip():
-            # very small parser; safe for typical prom label syntax
-            parts = []
-            cur = ""
-            in_q = False
-            for ch in rest:
-                if ch == '"':
-                    in_q = not in_q
-                if ch == "," and not in_q:
-                    parts.append(cur)
-                    cur = ""
-                else:
-                    cur += ch
-            if cur:
-                parts.append(cur)
-            for p in parts:
-                if "=" in p:
-                    k, vv = p.split("=", 1)
-                    labels[k.strip()] = vv.strip().strip('"')
+        labels: Dict[str, str] = dict(_LABEL_RE.findall(rest))
         return name, labels, v
     return left, {}, v
 
@@ -434,16 +554,27 @@ def restart_dpmpv2() -> tuple[bool, str]:
             import pathlib, time as _time
 
             pids: list[int] = []
-            for p in pathlib.Path("/proc").glob("[0-9]*"):
-                try:
-                    cmd = (p / "cmdline").read_bytes().replace(b"\x00", b" ").decode("utf-8", "ignore")
-                except Exception:
-                    continue
-                if "/app/dpmp/dpmpv2.py" in cmd or "dpmpv2.py" in cmd:
+            try:
+                # one process instead of opening every /proc/<pid>/cmdline ourselves
+                r = subprocess.run(
+                    ["pgrep", "-f", "dpmpv2.py"],
+                    capture_output=True,
+                    text=True,
+                    timeout=2,
+                )
+                pids = [int(x) for x in r.stdout.split() if x.isdigit()]
+            except FileNotFoundError:
+                # no procps in the image: scan /proc
+                for p in pathlib.Path("/proc").glob("[0-9]*"):
                     try:
-                        pids.append(int(p.name))
+                        cmd = (p / "cmdline").read_bytes().replace(b"\x00", b" ").decode("utf-8", "ignore")
                     except Exception:
-                        pass
+                        continue
+                    if "/app/dpmp/dpmpv2.py" in cmd or "dpmpv2.py" in cmd:
+                        try:
+                            pids.append(int(p.name))
+                        except Exception:
+                            pass
 
             if not pids:
                 return False, "container restart: dpmpv2 pid not found"
@@ -456,7 +587,12 @@ def restart_dpmpv2() -> tuple[bool, str]:
 
             _time.sleep(0.3)
 
+            # SIGKILL only what is still alive after the grace period
             for pid in pids:
+                try:
+                    os.kill(pid, 0)
+                except Exception:
+                    continue
                 try:
                     os.kill(pid, signal.SIGKILL)
                 except Exception:
@@ -480,7 +616,7 @@ def restart_dpmpv2() -> tuple[bool, str]:
         return False, str(e)
 
 
-@dataclass
+@dataclass(slots=True)
 class AppState:
     config_obj: Dict[str, Any]
     config_raw: str
@@ -746,7 +882,7 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
                 oracle_card = None  # no oracle panel when chain config is invalid
 
             # ---- SWITCH BUTTON HANDLERS ----
-            def _do_switch_to_oracle():
+            async def _do_switch_to_oracle():
                 """User clicked 'Switch to Oracle' on the slider panel."""
                 _mode["oracle_active"] = True
                 write_oracle_mode(True)
@@ -757,8 +893,9 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
                 # Immediately write the oracle's current weights to weights_override.json
                 # so the scheduler starts converging right away instead of waiting up to
                 # 10 minutes for the next oracle poll cycle.
+                _drop_pending_weight()
                 try:
-                    raw = http_get_text(METRICS_URL)
+                    raw = await get_metrics_shared()
                     wA = prom_value(raw, "dpmp_oracle_weight", {"pool": "A"})
                     wB = prom_value(raw, "dpmp_oracle_weight", {"pool": "B"})
                     if wA is not None and wB is not None and (int(wA) + int(wB)) > 0:
@@ -778,6 +915,7 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
                 # Write the current slider position to weights_override.json
                 # so DPMP immediately picks up the slider's weights
                 if weight_slider_ref is not None:
+                    _drop_pending_weight()
                     val = int(weight_slider_ref.value)
                     write_weight_override(val, 100 - val)
                 ui.notify("Switched to Slider mode", type="info")
@@ -916,10 +1054,10 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
                             return v
                     return None
 
-                def _update_oracle_panel():
+                async def _update_oracle_panel():
                     """Called every 2 seconds to refresh oracle panel from Prometheus metrics."""
                     try:
-                        raw = http_get_text(METRICS_URL)
+                        raw = await get_metrics_shared()
                         if not raw or not raw.strip():
                             _oracle_ui["health_dot"].style("color: red")
                             _oracle_ui["health_lbl"].text = "offline"
@@ -1112,8 +1250,26 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
                     f'<span style="color:#f59e0b">&#9650; Live override active ... DPMP is using these weights</span>'
                 )
 
+        # slider drags emit a burst of value changes; only the last one is written
+        _pending_weight: dict[str, tuple[int, int] | None] = {"wAB": None}
+
+        def _flush_weight_override():
+            """Write the latest pending slider weights (debounce timer callback)."""
+            weight_flush_timer.deactivate()
+            pending = _pending_weight["wAB"]
+            _pending_weight["wAB"] = None
+            if pending is not None:
+                write_weight_override(*pending)
+
+        def _drop_pending_weight():
+            """Discard an unwritten slider change (something else now owns the override file)."""
+            _pending_weight["wAB"] = None
+            weight_flush_timer.deactivate()
+
+        weight_flush_timer = ui.timer(0.25, _flush_weight_override, active=False)
+
         def _on_slider_change(e):
-            """Called when the slider value changes ... write override file immediately."""
+            """Called when the slider value changes ... write override file after a short debounce."""
             val = int(e.value)
             bval = 100 - val
             _update_weight_display()
@@ -1121,13 +1277,15 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
             # Only explicit Reset or Restart DPMP should delete the override.
             # This prevents a second browser session from accidentally nuking
             # an active override when its slider initializes.
-            write_weight_override(val, bval)
+            _pending_weight["wAB"] = (val, bval)
+            weight_flush_timer.activate()
 
         def _reset_weights():
             """Reset slider to config defaults and remove override file."""
             if weight_slider_ref is None:
                 return
             weight_slider_ref.value = cfg_slider_default
+            _drop_pending_weight()
             delete_weight_override()
             _update_weight_display()
             ui.notify("Weights reset to config defaults", type="info")
@@ -1314,31 +1472,39 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
 
         # Rolling window for "Recent Ratio" ... stores (timestamp, difA, difB) snapshots.
         # We keep ~2 minutes of history (at 2s poll interval, that's ~60 samples).
-        _recent_dif_history: list[tuple[float, float, float]] = []
+        _recent_dif_history: deque[tuple[float, float, float]] = deque()
         _RECENT_WINDOW_S = 300.0  # 5-minute rolling window
+        # last (rpctA, rpctB) computed from the history; reused while counters sit still
+        _recent_pct: dict[str, tuple[float, float] | None] = {"v": None}
+
+        # last running/stopped state applied to lbl_status (None = still the initial blue)
+        _status_color: dict[str, bool | None] = {"v": None}
 
         # periodic status update
-        def update_home_status() -> None:
+        async def update_home_status() -> None:
 
             # 1) dpmpv2 systemd state (bare-metal). In Docker this will be unavailable.
             active = False
             dc = 0
             try:
-                active = systemd_is_active("dpmpv2")
+                active = await systemd_is_active_async("dpmpv2")
             except Exception:
                 active = False
 
             # 2) metrics-derived status (regex, minimal)
             try:
-                raw = http_get_text(METRICS_URL)
+                raw = await get_metrics_shared()
 
                 # If we can successfully fetch metrics, DPMP is effectively "running"
                 # even if systemd isn't available (e.g., in Docker).
                 if raw and raw.strip():
                     active = True
 
-                a = _prom_gauge_value(raw, "dpmp_active_pool", pool="A")
-                b = _prom_gauge_value(raw, "dpmp_active_pool", pool="B")
+                # one pass over the metrics text, then dict lookups
+                prom = parse_prom_all(raw)
+
+                a = prom.get(("dpmp_active_pool", "A"))
+                b = prom.get(("dpmp_active_pool", "B"))
                 if (a or 0.0) >= 0.5:
                     lbl_pool.content = "<b>Active pool</b>: A"
                 elif (b or 0.0) >= 0.5:
@@ -1346,21 +1512,21 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
                 else:
                     lbl_pool.content = "<b>Active pool</b>: unknown"
 
-                dc = _prom_gauge_value(raw, "dpmp_downstream_connections")
+                dc = prom.get(("dpmp_downstream_connections", None))
                 if dc is None:
                     lbl_miner.content = "<b>Miner(s) connected</b>: unknown"
                 else:
-                    lbl_miner.content = f"<b>Miner(s) connected</b>: {'yes' if dc >= 1 else 'no'} (downstream={int(dc)})"
+                    lbl_miner.content = f"<b>Miner(s) connected</b>: {'yes' if dc >= 1 else 'no'} (downstream={dc:.0f})"
 
-                accA = _prom_gauge_value(raw, "dpmp_shares_accepted_total", pool="A") or 0.0
-                accB = _prom_gauge_value(raw, "dpmp_shares_accepted_total", pool="B") or 0.0
-                rejA = _prom_gauge_value(raw, "dpmp_shares_rejected_total", pool="A") or 0.0
-                rejB = _prom_gauge_value(raw, "dpmp_shares_rejected_total", pool="B") or 0.0
-                jobA = _prom_gauge_value(raw, "dpmp_jobs_forwarded_total", pool="A") or 0.0
-                jobB = _prom_gauge_value(raw, "dpmp_jobs_forwarded_total", pool="B") or 0.0
+                accA = prom.get(("dpmp_shares_accepted_total", "A")) or 0.0
+                accB = prom.get(("dpmp_shares_accepted_total", "B")) or 0.0
+                rejA = prom.get(("dpmp_shares_rejected_total", "A")) or 0.0
+                rejB = prom.get(("dpmp_shares_rejected_total", "B")) or 0.0
+                jobA = prom.get(("dpmp_jobs_forwarded_total", "A")) or 0.0
+                jobB = prom.get(("dpmp_jobs_forwarded_total", "B")) or 0.0
 
-                difA = _prom_gauge_value(raw, "dpmp_accepted_difficulty_sum_total", pool="A") or 0.0
-                difB = _prom_gauge_value(raw, "dpmp_accepted_difficulty_sum_total", pool="B") or 0.0
+                difA = prom.get(("dpmp_accepted_difficulty_sum_total", "A")) or 0.0
+                difB = prom.get(("dpmp_accepted_difficulty_sum_total", "B")) or 0.0
 
                 total_dif = difA + difB
                 pctA = 100*difA/(total_dif or 1)
@@ -1369,9 +1535,10 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
                 rejpA = 100*rejA/accA if accA > 0 else 0.0
                 rejpB = 100*rejB/accB if accB > 0 else 0.0
 
-                lbl_acc.content = f"<b>Accepted</b>: A {int(accA)} / B {int(accB)}"
-                lbl_rej.content = f"<b>Rejected</b>: A {int(rejA)} / B {int(rejB)} ({rejpA:.2f}% / {rejpB:.2f}%)"
-                lbl_jobs.content = f"<b>Jobs</b>: A {int(jobA)} / B {int(jobB)}"
+                # counters are whole numbers exported as floats; format them directly
+                lbl_acc.content = f"<b>Accepted</b>: A {accA:.0f} / B {accB:.0f}"
+                lbl_rej.content = f"<b>Rejected</b>: A {rejA:.0f} / B {rejB:.0f} ({rejpA:.2f}% / {rejpB:.2f}%)"
+                lbl_jobs.content = f"<b>Jobs</b>: A {jobA:.0f} / B {jobB:.0f}"
                 #lbl_dif.content = f"<b>SumDiff</b>: A {int(difA)} / B {int(difB)}"
                 lbl_dif.content = f"<b>SumDiff</b>: A {_fmt_short(difA)} / B {_fmt_short(difB)}"
                 lbl_rat.content = f"<b>Diff Ratio (all-time)</b>: A {pctA:.2f}% / B {pctB:.2f}%"
@@ -1379,8 +1546,8 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
                 # Scheduler Ratio -- reads the averaged per-miner time-ratio
                 # directly from the Prometheus gauge.  This is instantaneous,
                 # stable, and reflects what the scheduler is actually doing.
-                _schedA = _prom_gauge_value(raw, "dpmp_scheduler_share", pool="A")
-                _schedB = _prom_gauge_value(raw, "dpmp_scheduler_share", pool="B")
+                _schedA = prom.get(("dpmp_scheduler_share", "A"))
+                _schedB = prom.get(("dpmp_scheduler_share", "B"))
                 if _schedA is not None and _schedB is not None:
                     _spctA = 100.0 * _schedA
                     _spctB = 100.0 * _schedB
@@ -1402,14 +1569,39 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
                 _rdifA = difA  # already read above from dpmp_accepted_difficulty_sum_total
                 _rdifB = difB
                 now_mono = time.monotonic()
-                _recent_dif_history.append((now_mono, _rdifA, _rdifB))
+                _h = _recent_dif_history
+                # Counters unchanged since last poll: a run of identical samples only
+                # contributes zero deltas, so keep just its first and last entry and
+                # slide the last one forward instead of appending.
+                _idle = bool(_h) and _h[-1][1] == _rdifA and _h[-1][2] == _rdifB
+                if _idle and len(_h) >= 2 and _h[-2][1] == _rdifA and _h[-2][2] == _rdifB:
+                    _h[-1] = (now_mono, _rdifA, _rdifB)
+                else:
+                    _h.append((now_mono, _rdifA, _rdifB))
 
                 # Trim entries older than the window
                 cutoff = now_mono - _RECENT_WINDOW_S
-                while _recent_dif_history and _recent_dif_history[0][0] < cutoff:
-                    _recent_dif_history.pop(0)
-
-                if len(_recent_dif_history) >= 2:
+                _trimmed = False
+                while _h and _h[0][0] < cutoff:
+                    if len(_h) >= 2 and _h[1][0] >= cutoff and _h[1][1:] == _h[0][1:]:
+                        # idle run straddles the cutoff: clip its start to the window edge
+                        _h[0] = (cutoff, _h[0][1], _h[0][2])
+                        break
+                    _h.popleft()
+                    _trimmed = True
+
+                if len(_recent_dif_history) >= 2 and _idle and not _trimmed and _recent_pct["v"] is not None:
+                    # Nothing new and nothing aged out: every weight decays by the same
+                    # factor, so the percentages are unchanged; only the window label moves.
+                    rpctA, rpctB = _recent_pct["v"]
+                    window_s = now_mono - _recent_dif_history[0][0]
+                    lbl_recent_rat.content = (
+                        f'<b>Recent Diff ({int(window_s)}s)</b>: '
+                        f'<span style="color:#22d3ee">A {rpctA:.1f}%</span>'
+                        f' / '
+                        f'<span style="color:#f59e0b">B {rpctB:.1f}%</span>'
+                    )
+                elif len(_recent_dif_history) >= 2:
                     # Compute exponentially-weighted difficulty deltas.
                     # Each consecutive pair contributes (delta_A, delta_B),
                     # weighted by exp(-age / half_life * ln2).
@@ -1418,9 +1610,10 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
                     _wsum_A = 0.0
                     _wsum_B = 0.0
                     _wsum_total = 0.0
-                    for i in range(1, len(_recent_dif_history)):
-                        _ts_prev, _a_prev, _b_prev = _recent_dif_history[i - 1]
-                        _ts_curr, _a_curr, _b_curr = _recent_dif_history[i]
+                    # Walk consecutive pairs by iteration (deque indexing is O(n) mid-queue).
+                    _it = iter(_recent_dif_history)
+                    _ts_prev, _a_prev, _b_prev = next(_it)
+                    for _ts_curr, _a_curr, _b_curr in _it:
                         _da = _a_curr - _a_prev
                         _db = _b_curr - _b_prev
                         # Weight by midpoint age (average of the two timestamps)
@@ -1429,10 +1622,12 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
                         _wsum_A += _da * _w
                         _wsum_B += _db * _w
                         _wsum_total += (_da + _db) * _w
+                        _ts_prev, _a_prev, _b_prev = _ts_curr, _a_curr, _b_curr
 
                     if _wsum_total > 0:
                         rpctA = 100.0 * _wsum_A / _wsum_total
                         rpctB = 100.0 * _wsum_B / _wsum_total
+                        _recent_pct["v"] = (rpctA, rpctB)
                         window_s = now_mono - _recent_dif_history[0][0]
                         lbl_recent_rat.content = (
                             f'<b>Recent Diff ({int(window_s)}s)</b>: '
@@ -1441,6 +1636,7 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
                             f'<span style="color:#f59e0b">B {rpctB:.1f}%</span>'
                         )
                     else:
+                        _recent_pct["v"] = None
                         lbl_recent_rat.content = "<b>Recent Diff (5min)</b>: no new shares yet..."
                 else:
                     lbl_recent_rat.content = "<b>Recent Diff (5min)</b>: collecting data..."
@@ -1456,10 +1652,13 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
 
             # Final status display (works for both bare-metal and Docker)
             lbl_dpmp.content = f"<b>DPMP</b>: {'running' if active else 'stopped'}"
-            lbl_status.style('color: green;' if active else 'color: red;')
+            # .style() re-parses and pushes an update on every call; only touch it on a flip
+            if _status_color["v"] != active:
+                _status_color["v"] = active
+                lbl_status.style('color: green;' if active else 'color: red;')
             lbl_spin.visible = active and dc >= 1
 
-        update_home_status()
+        ui.timer(0.0, update_home_status, once=True)
         ui.timer(2.0, update_home_status)
 
     # =====================================================================
@@ -1564,7 +1763,7 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
         _bridge_miner_id = _sort_bridge_miner.id
         _bridge_pool_id = _sort_bridge_pool.id
 
-        def _on_miner_header_click(e):
+        async def _on_miner_header_click(e):
             val = e.args if isinstance(e.args, str) else (e.args or {}).get("key", "")
             if not val:
                 return
@@ -1574,9 +1773,9 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
             else:
                 _miner_sort["key"] = col_key
                 _miner_sort["reverse"] = col_key != "name"
-            update_stats()
+            await update_stats()
 
-        def _on_pool_header_click(e):
+        async def _on_pool_header_click(e):
             val = e.args if isinstance(e.args, str) else (e.args or {}).get("key", "")
             if not val:
                 return
@@ -1586,7 +1785,7 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
             else:
                 _pool_sort["key"] = col_key
                 _pool_sort["reverse"] = col_key not in ("pool_name", "slot", "chain")
-            update_stats()
+            await update_stats()
 
         _sort_bridge_miner.on("sort_click", _on_miner_header_click)
         _sort_bridge_pool.on("sort_click", _on_pool_header_click)
@@ -1598,7 +1797,7 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
                 return f'<span class="sa">{arrow}</span>'
             return '<span class="sa">&#8693;</span>'
 
-        def update_stats():
+        async def update_stats():
             """Poll worker_stats.json + Prometheus and rebuild both tables."""
             try:
                 ws = read_worker_stats()
@@ -1696,15 +1895,16 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
 
                 # Read Prometheus for per-pool accepted/rejected/jobs/diffsum
                 try:
-                    raw = http_get_text(METRICS_URL)
+                    raw = await get_metrics_shared()
                 except Exception:
                     raw = ""
 
+                prom = parse_prom_all(raw)
                 pool_data = []
                 for pk in ("A", "B"):
                     pi = pool_info.get(pk, {})
-                    acc = _prom_gauge_value(raw, "dpmp_shares_accepted_total", pool=pk) or 0.0
-                    rej = _prom_gauge_value(raw, "dpmp_shares_rejected_total", pool=pk) or 0.0
+                    acc = prom.get(("dpmp_shares_accepted_total", pk)) or 0.0
+                    rej = prom.get(("dpmp_shares_rejected_total", pk)) or 0.0
                     total = acc + rej
                     pool_data.append({
                         "pool_name": pi.get("name", f"Pool {pk}"),
@@ -1714,8 +1914,8 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
                         "accepted": acc,
                         "rejected": rej,
                         "rej_pct": (rej / total * 100) if total > 0 else 0.0,
-                        "jobs": _prom_gauge_value(raw, "dpmp_jobs_forwarded_total", pool=pk) or 0.0,
-                        "tdiff": _prom_gauge_value(raw, "dpmp_accepted_difficulty_sum_total", pool=pk) or 0.0,
+                        "jobs": prom.get(("dpmp_jobs_forwarded_total", pk)) or 0.0,
+                        "tdiff": prom.get(("dpmp_accepted_difficulty_sum_total", pk)) or 0.0,
                     })
 
                 # Sort pool table
@@ -1756,7 +1956,7 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
             except Exception as e:
                 stats_miner_html.content = f'<span style="color:#f87171">Error: {e}</span>'
 
-        update_stats()
+        ui.timer(0.0, update_stats, once=True)
         ui.timer(5.0, update_stats)
 
         # Inject JS click handler for sortable column headers.
@@ -1804,7 +2004,6 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
             "post_auth_extranonce_skip_raw_subscribe",
             "post_auth_push_diff","post_auth_push_extranonce",
             "post_auth_push_notify_clean",
-            "prune_internal_ids","prune_job_owner","prune_seen_upstream_ids","prune_submit_owner",
             "scheduler_tick",
             "send_upstream_flush_done","send_upstream_flush_start","send_upstream_queued",
             "share_result",
@@ -1815,13 +2014,14 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
         ]
 
         # --- all log events (canonical list; keep in sync with dpmpv2.py log("...") calls) ---
-        ALL_EVENTS = [
+        # immutable, de-duplicated in order so a repeated entry can't show up twice in the selector
+        ALL_EVENTS: tuple[str, ...] = tuple(dict.fromkeys([
             "auth_result","authorize_rewrite","authorize_rewrite_other","authorize_rewrite_other_error",
             "authorize_rewrite_secondary","authorize_secondary_send_error","authorize_skip_zero_weight_pool",
             "bootstrap_handshake_from_en2_hint",
             "bootstrap_reconnect_forced","bootstrap_skipped_handshake_pool",
             "clear_pool_state_reset_last_downstream_extranonce","clear_pool_state_reset_raw_subscribe_flag",
-            "config_loaded","config_safety_max_deviation_clamped","config_safety_min_switch_clamped",
+            "config_invalid_notify_delay","config_loaded","config_safety_max_deviation_clamped","config_safety_min_switch_clamped",
             "config_safety_oracle_poll_clamped","config_safety_slice_clamped",
             "configure_forward_both_error","configure_forwarded_both_pools","configure_skip_zero_weight_pool",
             "downstream_diff_set","downstream_extranonce_check","downstream_extranonce_send_error",
@@ -1840,6 +2040,7 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
             "active_pool_from_en2_hint",
             "id_response_seen",
             "job_forwarded","job_forwarded_diff_state",
+            "log_dropped",
             "metrics_start_failed","metrics_started","miner_bad_json","miner_connected",
             "miner_disconnect_for_reconnect","miner_disconnect_for_reconnect_failed",
             "miner_disconnected","miner_method","miner_ready_for_jobs",
@@ -1862,19 +2063,17 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
             "post_auth_downstream_sync","post_auth_downstream_sync_error",
             "post_auth_extranonce_skip_already_in_subscribe","post_auth_extranonce_skip_raw_subscribe",
             "post_auth_push_diff",
-            "post_auth_push_extranonce","post_auth_push_notify_clean","post_auth_push_notify_clean_error",
+            "post_auth_push_extranonce","post_auth_push_notify_clean",
             "post_auth_push_setup_error","process_exiting",
-            "prune_internal_ids","prune_job_owner","prune_seen_upstream_ids","prune_submit_owner",
             "resend_notify_clean","resend_notify_error","resend_notify_raw",
             "resend_notify_skipped_no_cached",
             "scheduler_config_validated","scheduler_tick",
             "send_upstream_flush_done","send_upstream_flush_start","send_upstream_queued",
-            "session_error","share_result",
+            "session_error","session_state_report_error","session_state_sizes","share_result",
             "shutdown_begin","shutdown_cancel_tasks","shutdown_done","shutdown_keyboard_interrupt",
-            "shutdown_serve_task_cancel_begin","shutdown_serve_task_cancel_done",
-            "shutdown_serve_task_cancel_timeout","shutdown_serve_task_error",
-            "shutdown_server_close_begin","shutdown_server_close_done","shutdown_server_close_error",
-            "shutdown_server_close_timeout","shutdown_signal","shutdown_timeout",
+            "shutdown_server_close_begin","shutdown_server_close_error",
+            "shutdown_signal","shutdown_timeout",
+            "socket_busy_poll_failed",
             "submit_dedupe_error","submit_dropped_duplicate_fp","submit_dropped_extranonce_mismatch",
             "submit_dropped_no_job_yet","submit_dropped_pool_dead","submit_dropped_unknown_jid",
             "submit_extranonce_mismatch_grace_forward","submit_local_sanity","submit_local_sanity_error",
@@ -1883,7 +2082,12 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
             "switch_skipped_no_cached_job",
             "upstream_response_dup_observed","upstream_tx",
             "weights_normalized","weights_override_changed","write_failed",
-        ]
+        ]))
+
+        # derived once instead of on every reset/apply
+        _DEFAULT_DENY_SET = frozenset(DEFAULT_DENY)
+        _ALL_EVENTS_SET = frozenset(ALL_EVENTS)
+        _DEFAULT_LOGGED = tuple(ev for ev in ALL_EVENTS if ev not in _DEFAULT_DENY_SET)
 
         # --- controls (created first; populated by reload_cfg) ---
 
@@ -1898,43 +2102,34 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
             listen_host = ui.input("Host").classes("w-64")
             listen_port = ui.number("Port", precision=0).props("step=1 min=1 max=65535").classes("w-64")
 
-        # Logging (checkbox per event; deny[] only; allow[] left empty)
+        # Logging (one multi-select of logged events; deny[] only; allow[] left empty)
         with ui.expansion("Logging Settings:", icon="settings").classes("w-full"):
-            ui.label("Check the events that you want to log. Certain events, while useful for debugging purposes, can generate a lot of log output very quickly. When in doubt, just click on the Reset to Defaults button to return to standard 'maintenance-mode' logging.").classes("text-sm")
+            ui.label("Select the events that you want to log. Certain events, while useful for debugging purposes, can generate a lot of log output very quickly. When in doubt, just click on the Reset to Defaults button to return to standard 'maintenance-mode' logging.").classes("text-sm")
             ui.label("Warning: Logging all events can create a very large log file quickly.").classes("text-sm text-red-600")
 
-            logging_event_cbs = {}  # event -> checkbox
+            log_sel = None  # ui.select of logged (= not denied) events
 
             if not ALL_EVENTS:
                 ui.label("No log events list available.").classes("text-sm text-orange-700")
             else:
                 with ui.row().classes("items-center gap-2"):
-                    btn_all  = ui.button("Check All").props("dense outline").classes("text-xs")
-                    btn_none = ui.button("Uncheck All").props("dense outline").classes("text-xs")
+                    btn_all  = ui.button("Select All").props("dense outline").classes("text-xs")
+                    btn_none = ui.button("Select None").props("dense outline").classes("text-xs")
                     btn_reset = ui.button("Reset to Defaults").props("dense outline").classes("text-xs")
 
-                cols = 3
-                rows = (len(ALL_EVENTS) + cols - 1) // cols
-
-                # on desktop show 3 columns; on mobile, stack into 1 column
-                with ui.element('div').classes('grid grid-cols-1 sm:grid-cols-3 w-full gap-4 sm:gap-6'):
-                    for c in range(cols):
-                        with ui.column().classes("min-w-0"):
-                            for r in range(rows):
-                                idx = c * rows + r
-                                if idx >= len(ALL_EVENTS):
-                                    break
-                                ev = ALL_EVENTS[idx]
-                                logging_event_cbs[ev] = ui.checkbox(ev, value=True).classes("text-xs sm:text-sm")
+                # a single component instead of one checkbox per event; type to filter
+                log_sel = ui.select(
+                    options=list(ALL_EVENTS),
+                    multiple=True,
+                    with_input=True,
+                    label="Logged events",
+                ).classes("w-full text-xs sm:text-sm")
 
                 def _set_all_events(val: bool):
-                    for cb in logging_event_cbs.values():
-                        cb.value = bool(val)
+                    log_sel.value = list(ALL_EVENTS) if val else []
 
                 def _reset_defaults():
-                    deny = set(DEFAULT_DENY)
-                    for ev, cb in logging_event_cbs.items():
-                        cb.value = (ev not in deny)                        
+                    log_sel.value = list(_DEFAULT_LOGGED)
 
                 btn_all.on("click", lambda: _set_all_events(True))
                 btn_none.on("click", lambda: _set_all_events(False))
@@ -2029,24 +2224,20 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
             cfg["logging"].setdefault("json", True)
             cfg["logging"].setdefault("level", "INFO")
 
-        def _apply_logging_checkboxes(cfg: dict) -> None:
+        def _apply_logging_selection(cfg: dict) -> None:
             _ensure_logging_defaults(cfg)
-            deny = []
-            for ev, cb in logging_event_cbs.items():
-                try:
-                    if not bool(cb.value):
-                        deny.append(ev)
-                except Exception:
-                    deny.append(ev)
-            deny.sort()
+            if log_sel is None:
+                return
+            # unselected => denied
+            deny = sorted(_ALL_EVENTS_SET.difference(log_sel.value or []))
             cfg["logging"]["allow"] = []   # explicit: leave empty
-            cfg["logging"]["deny"] = deny  # unchecked => denied
+            cfg["logging"]["deny"] = deny
 
-        def _set_checkboxes_from_cfg(cfg: dict) -> None:
+        def _set_logging_selection_from_cfg(cfg: dict) -> None:
             deny = _safe_get(cfg, ["logging", "deny"], []) or []
-            deny_set = set([str(x) for x in deny])
-            for ev, cb in logging_event_cbs.items():
-                cb.value = (ev not in deny_set)
+            deny_set = {str(x) for x in deny}
+            if log_sel is not None:
+                log_sel.value = [ev for ev in ALL_EVENTS if ev not in deny_set]
 
         def reload_cfg():
             global state
@@ -2065,9 +2256,9 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
             listen_host.value = str(_safe_get(cfg, ["listen", "host"], "0.0.0.0") or "")
             listen_port.value = _to_int(_safe_get(cfg, ["listen", "port"], 3351), 3351)
 
-            # logging (checkboxes -> from deny[])
+            # logging (selection <- deny[])
             _ensure_logging_defaults(cfg)
-            _set_checkboxes_from_cfg(cfg)
+            _set_logging_selection_from_cfg(cfg)
 
             # metrics
             metrics_host.value    = str(_safe_get(cfg, ["metrics", "host"], "0.0.0.0") or "")
@@ -2125,8 +2316,8 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
             cfg["listen"]["host"] = str(listen_host.value or "").strip()
             cfg["listen"]["port"] = _to_int(listen_port.value, 3351)
 
-            # logging (checkboxes -> deny[])
-            _apply_logging_checkboxes(cfg)
+            # logging (selection -> deny[])
+            _apply_logging_selection(cfg)
 
             # metrics
             cfg.setdefault("metrics", {})
@@ -2226,30 +2417,43 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
               - Legacy P2PKH: 1 + 25-34 base58 chars
               - Legacy P2SH:  3 + 25-34 base58 chars
             """
-            # BTC bech32 (mainnet)
-            text = re.sub(r'\bbc1[qpzry9x8gf2tvdw0s3jn54khce6mua7l]{38,58}\b', '[REDACTED]', text)
-            # BCH cashaddr (with prefix)
-            text = re.sub(r'\bbitcoincash:[qp][a-z0-9]{41,}\b', '[REDACTED]', text)
-            # BCH short cashaddr (no prefix ... starts with q or p + 41 alnum)
-            text = re.sub(r'\b[qp][a-z0-9]{41,55}\b', '[REDACTED]', text)
-            # Legacy addresses (1... or 3...)
-            text = re.sub(r'\b[13][a-km-zA-HJ-NP-Z1-9]{25,34}\b', '[REDACTED]', text)
-            return text
+            return _WALLET_RE.sub('[REDACTED]', text)
 
         def _do_download():
             """Read the full log, optionally redact wallets, zip it, trigger browser download."""
             try:
-                # Read the FULL log (not truncated like the display)
-                log_text = read_text_file(DPMP_LOG_PATH, max_bytes=100_000_000)  # up to ~100 MB
+                redact = bool(chk_redact.value)
+                chunk_size = 1 << 20
 
-                if chk_redact.value:
-                    log_text = _redact_wallets(log_text)
-
-                # Build zip in memory
+                # Stream the FULL log (not truncated like the display; last ~100 MB) through
+                # the compressor in 1 MiB blocks instead of holding text + zip copies in memory
                 buf = io.BytesIO()
-                with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
-                    zf.writestr("dpmpv2_run.log", log_text)
-                buf.seek(0)
+                with open(DPMP_LOG_PATH, "rb") as src, \
+                        zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf, \
+                        zf.open("dpmpv2_run.log", "w", force_zip64=True) as entry:
+                    size = os.fstat(src.fileno()).st_size
+                    src.seek(max(0, size - 100_000_000))
+                    carry = b""
+                    while True:
+                        chunk = src.read(chunk_size)
+                        if not redact:
+                            if not chunk:
+                                break
+                            entry.write(chunk)
+                            continue
+                        if chunk:
+                            # redact whole lines only, so an address never straddles two blocks
+                            data = carry + chunk
+                            cut = data.rfind(b"\n") + 1
+                            carry = data[cut:]
+                            data = data[:cut]
+                        else:
+                            data, carry = carry, b""
+                        if data:
+                            text = _redact_wallets(data.decode("utf-8", errors="replace"))
+                            entry.write(text.encode("utf-8"))
+                        if not chunk:
+                            break
                 zip_bytes = buf.getvalue()
 
                 # Generate filename with timestamp
@@ -2269,12 +2473,28 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
             state.log_filter = inp_filter.value or ""
             state.freeze_logs = bool(chk_freeze.value)
 
-        inp_filter.on("change", lambda: apply_ui_state())
+        # coalesce bursts of change events; the logs loop picks up the last value
+        inp_filter.on("change", lambda: apply_ui_state(), throttle=0.3, leading_events=False)
         chk_freeze.on("change", lambda: apply_ui_state())
 
+        # incremental tail state for tail_log_delta(); the last ~LOG_VIEW_BYTES of complete
+        # lines are kept decoded (newest first, as displayed), plus any trailing partial line as bytes
+        LOG_VIEW_BYTES = 180_000
+        log_tail: Dict[str, Any] = {"off": 0, "ino": None, "carry": b"", "nbytes": 0}
+        log_lines: deque[str] = deque()
+        last_log_filter: list[str | None] = [None]
+
+        def _reset_log_view():
+            log_tail["carry"] = b""
+            log_tail["nbytes"] = 0
+            log_lines.clear()
+            last_log_filter[0] = None
+
         def jump_end():
             # just forces a refresh next tick
             state.last_log_len = 0
+            log_tail["off"] = 0
+            log_tail["ino"] = None
 
         #btn_jump.on("click", lambda: jump_end())
 
@@ -2283,17 +2503,40 @@ with ui.tab_panels(tabs, value=t_home).classes("w-full"):
                 try:                    
                     state.freeze_logs = bool(chk_freeze.value)
                     if not state.freeze_logs:
-                        txt = read_text_file(DPMP_LOG_PATH, max_bytes=180_000)
-
-                        # newest-first
-                        lines = txt.splitlines()
                         flt = (state.log_filter or "").strip()
-                        if flt:
-                            lines = [ln for ln in reversed(lines) if flt in ln]
-                        else:
-                            lines = list(reversed(lines))
-
-                        log_box.value = "\n".join(lines)
+                        try:
+                            new, reset = tail_log_delta(DPMP_LOG_PATH, log_tail, max_bytes=LOG_VIEW_BYTES)
+                        except FileNotFoundError:
+                            log_tail["off"] = 0
+                            log_tail["ino"] = None
+                            _reset_log_view()
+                            last_log_filter[0] = flt  # keep the placeholder until the file is back
+                            log_box.value = f"[missing] {DPMP_LOG_PATH}"
+                            new, reset = b"", False
+                        state.last_log_len = log_tail["off"]
+                        if reset:
+                            _reset_log_view()
+
+                        if new:
+                            # decode only whole lines; a partial last line waits for its newline
+                            data = log_tail["carry"] + new
+                            cut = data.rfind(b"\n") + 1
+                            log_tail["carry"] = data[cut:]
+                            fresh = data[:cut].decode("utf-8", errors="replace").splitlines()
+                            log_tail["nbytes"] += sum(map(len, fresh)) + len(fresh)
+                            log_lines.extendleft(fresh)  # ends up newest-first
+                            while log_lines and log_tail["nbytes"] > LOG_VIEW_BYTES:
+                                log_tail["nbytes"] -= len(log_lines.pop()) + 1
+
+                        # only re-render when the log grew, was truncated/replaced, or the filter changed
+                        if new or reset or flt != last_log_filter[0]:
+                            last_log_filter[0] = flt
+
+                            # log_lines is already newest-first
+                            if flt:
+                                log_box.value = "\n".join(ln for ln in log_lines if flt in ln)
+                            else:
+                                log_box.value = "\n".join(log_lines)
                         lbl_logs.text = f"{now_utc()}  file={DPMP_LOG_PATH}"
                 except Exception as e:
                     lbl_logs.text = f"log error: {e}"
@@ -0,0 +1,47 @@
+(function () {
+  const KEY = 'dpmp_dark_mode';
+
+  function desiredIsDark() {
+    const v = localStorage.getItem(KEY);
+    return (v === '1' || v === 'true');
+  }
+
+  function applyThemeAndSwitch() {
+    try {
+      const isDark = desiredIsDark();
+
+      // Apply theme if Quasar is ready
+      if (window.Quasar && Quasar.Dark) {
+        Quasar.Dark.set(isDark);
+      }
+
+      // Sync switch state (NiceGUI/Quasar may re-render, so keep forcing it)
+      const input = document.querySelector('#dpmp_dark_switch input[type="checkbox"]');
+      if (input && input.checked !== isDark) {
+        input.checked = isDark;
+      }
+
+      // "ready" when Quasar exists AND switch input exists
+      return !!(window.Quasar && Quasar.Dark) && !!input;
+    } catch (e) {
+      return false;
+    }
+  }
+
+  // Re-check only when the DOM actually changes (late Quasar init + component
+  // re-renders) instead of polling; stop on first success or after ~5s.
+  function start() {
+    if (applyThemeAndSwitch()) return;
+    const obs = new MutationObserver(() => {
+      if (applyThemeAndSwitch()) obs.disconnect();
+    });
+    obs.observe(document.body, { childList: true, subtree: true });
+    setTimeout(() => obs.disconnect(), 5000);
+  }
+
+  if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', start);
+  } else {
+    start();
+  }
+})();